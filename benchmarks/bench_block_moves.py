@@ -0,0 +1,40 @@
+'''
+比较单点移动与块移动模式的等效单点移动速率和拟合程度。
+    python benchmarks/bench_block_moves.py [源数据集] [目标图形]
+'''
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from same_stats import algo
+from same_stats.utils import read_point_csv, resolve_source_path, resolve_target
+
+N_ITER = 5000
+
+
+def bench(source, target, block_size: int, block_policy: str):
+    np.random.seed(0)
+    transformer = algo.SameStatsTransformation(source, target, N_ITER,
+                                               block_size=block_size,
+                                               block_policy=block_policy)
+    while not transformer.iterate(): pass
+    return transformer.metrics, algo.mean_distance(transformer.cur_state, target)
+
+
+if __name__ == '__main__':
+    source_name = sys.argv[1] if len(sys.argv) > 1 else 'datasaurus'
+    target_name = sys.argv[2] if len(sys.argv) > 2 else 'x'
+    home = Path(__file__).parent.parent / 'seed_datasets'
+    source = read_point_csv(resolve_source_path(source_name, home))
+    target = resolve_target(target_name)
+
+    print(f"{'B':>4}{'policy':>8}{'iters/s':>10}{'moves/s':>10}"
+          f"{'moves/iter':>12}{'distance':>10}")
+    for block_size, block_policy in [(1, 'greedy'), (4, 'all'), (4, 'greedy'),
+                                     (16, 'all'), (16, 'greedy'), (64, 'greedy')]:
+        m, dist = bench(source, target, block_size, block_policy)
+        print(f'{block_size:>4}{block_policy:>8}{m.iters_per_sec:>10.0f}'
+              f'{m.point_moves_per_sec:>10.0f}{m.n_point_moves / m.n_iters:>12.2f}{dist:>10.3f}')
@@ -0,0 +1,45 @@
+'''
+比较单点模式下开、关余量预判的迭代速度，并核对两者的轨迹完全一致。
+    python benchmarks/bench_prefilter.py [源数据集] [目标图形] [迭代数]
+'''
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from same_stats import algo
+from same_stats.utils import read_point_csv, resolve_source_path, resolve_target
+
+SEED = 0
+
+
+def run(source, target, n_iter: int, n_error_trunc: int, prefilter: bool):
+    np.random.seed(SEED)
+    transformer = algo.SameStatsTransformation(source, target, n_iter,
+                                               n_error_trunc=n_error_trunc,
+                                               prefilter=prefilter)
+    while not transformer.iterate(): pass
+    return transformer
+
+
+if __name__ == '__main__':
+    source_name = sys.argv[1] if len(sys.argv) > 1 else 'datasaurus'
+    target_name = sys.argv[2] if len(sys.argv) > 2 else 'x'
+    n_iter = int(sys.argv[3]) if len(sys.argv) > 3 else 20000
+    home = Path(__file__).parent.parent / 'seed_datasets'
+    source = read_point_csv(resolve_source_path(source_name, home))
+    target = resolve_target(target_name)
+
+    print(f"{'trunc':>6}{'exact(it/s)':>13}{'prefilter(it/s)':>17}{'speedup':>9}"
+          f"{'accept':>8}{'decided':>9}{'exact checks':>14}{'same':>6}")
+    for n_error_trunc in (1, 2, 3):
+        exact = run(source, target, n_iter, n_error_trunc, False)
+        fast = run(source, target, n_iter, n_error_trunc, True)
+        same = np.array_equal(exact.cur_state.to_numpy(), fast.cur_state.to_numpy())
+        m = fast.metrics
+        print(f'{n_error_trunc:>6}{exact.metrics.iters_per_sec:>13.0f}{m.iters_per_sec:>17.0f}'
+              f'{m.iters_per_sec / exact.metrics.iters_per_sec:>9.1f}'
+              f'{m.acceptance_rate:>8.3f}{m.prefilter_rate:>9.4f}{m.n_exact_checks:>14}'
+              f"{'yes' if same else 'NO':>6}")
@@ -0,0 +1,50 @@
+'''
+比较均匀选点与按距离加权选点达到给定拟合程度所需的迭代数。
+    python benchmarks/bench_row_selection.py [源数据集] [目标图形] [目标平均距离]
+'''
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from same_stats import algo
+from same_stats.utils import read_point_csv, resolve_source_path, resolve_target
+
+MAX_ITER = 60000
+CHECK_EVERY = 250
+SEEDS = (0, 1, 2)
+
+
+def iters_to_fit(source, target, goal: float, seed: int, **params) -> tuple[int, float]:
+    '''返回(达到目标平均距离时的迭代数, 耗时)，没达到时迭代数为MAX_ITER'''
+    np.random.seed(seed)
+    transformer = algo.SameStatsTransformation(source, target, MAX_ITER, **params)
+    while not transformer.iterate():
+        if transformer.cur_iter % CHECK_EVERY: continue
+        if algo.mean_distance(transformer.cur_state, target) <= goal: break
+    return transformer.cur_iter, transformer.metrics.elapsed
+
+
+if __name__ == '__main__':
+    source_name = sys.argv[1] if len(sys.argv) > 1 else 'datasaurus'
+    target_name = sys.argv[2] if len(sys.argv) > 2 else 'x'
+    goal = float(sys.argv[3]) if len(sys.argv) > 3 else 4.0
+    home = Path(__file__).parent.parent / 'seed_datasets'
+    source = read_point_csv(resolve_source_path(source_name, home))
+    target = resolve_target(target_name)
+
+    configs = [
+        ('uniform', {}),
+        ('distance, floor=0.05', {'row_selection': 'distance', 'selection_floor': 0.05}),
+        ('distance, floor=0.1', {'row_selection': 'distance', 'selection_floor': 0.1}),
+        ('distance, floor=0.3', {'row_selection': 'distance', 'selection_floor': 0.3}),
+    ]
+    print(f'{source_name} -> {target_name}，目标平均距离 {goal}，上限 {MAX_ITER} 次迭代')
+    print(f"{'selection':>22}{'iters (per seed)':>28}{'mean iters':>12}{'time(s)':>10}")
+    for name, params in configs:
+        results = [iters_to_fit(source, target, goal, seed, **params) for seed in SEEDS]
+        iters = [r[0] for r in results]
+        print(f"{name:>22}{str(iters):>28}{np.mean(iters):>12.0f}"
+              f"{np.mean([r[1] for r in results]):>10.2f}")
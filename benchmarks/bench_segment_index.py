@@ -0,0 +1,50 @@
+'''
+比较LineShapeDestination逐条扫描与网格索引（逐点/批量）的距离查询耗时。
+    python benchmarks/bench_segment_index.py
+'''
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from same_stats.algo.dest_types import PolylineDestination
+
+N_QUERIES = 2000
+
+
+def traced_outline(n_segments: int) -> list[tuple[float, float]]:
+    '''模拟描出来的logo轮廓：一条带花边的闭合曲线'''
+    theta = np.linspace(0, 2 * np.pi, n_segments, endpoint=False)
+    r = 30 + 8 * np.sin(7 * theta) + 3 * np.sin(31 * theta)
+    return list(zip(50 + r * np.cos(theta), 50 + r * np.sin(theta)))
+
+def time_queries(dest: PolylineDestination, queries: np.ndarray) -> tuple[float, np.ndarray]:
+    t_start = time.perf_counter()
+    dists = np.array([dest.distance((x, y)) for x, y in queries])
+    return (time.perf_counter() - t_start) / len(queries), dists
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    queries = rng.uniform(0, 100, (N_QUERIES, 2))
+    print(f"{'segments':>10}{'linear(us)':>14}{'grid(us)':>14}{'batch(us)':>12}"
+          f"{'speedup':>10}{'build(ms)':>12}")
+    for n_segments in (10, 100, 1000, 10000):
+        points = traced_outline(n_segments)
+        linear = PolylineDestination(points, True, use_index=False)
+        t_start = time.perf_counter()
+        indexed = PolylineDestination(points, True, use_index=True)
+        t_build = time.perf_counter() - t_start
+
+        t_linear, d_linear = time_queries(linear, queries)
+        t_grid, d_grid = time_queries(indexed, queries)
+        assert np.allclose(d_linear, d_grid)
+        t_start = time.perf_counter()
+        d_batch = indexed.distances(queries)
+        t_batch = (time.perf_counter() - t_start) / len(queries)
+        assert np.array_equal(d_grid, d_batch)
+        print(f'{n_segments:>10}{t_linear * 1e6:>14.1f}{t_grid * 1e6:>14.1f}{t_batch * 1e6:>12.1f}'
+              f'{t_linear / t_grid:>10.1f}{t_build * 1e3:>12.2f}')
@@ -0,0 +1,90 @@
+'''
+比较多进程任务随参数pickle整份数据与通过共享内存传句柄的派发延迟和工作进程内存。
+数据为一个大点集加一个带网格索引的一万条线段的目标图形。
+    python benchmarks/bench_shared_memory.py [点数] [线段数]
+'''
+
+import multiprocessing as mp
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from same_stats.algo.dest_types import IDestination, PolylineDestination
+from same_stats.shm import SharedArrayRegistry, attach_destination, attach_points
+
+N_WORKERS = 4
+N_TASKS = 200
+
+
+def traced_outline(n_segments: int) -> list[tuple[float, float]]:
+    theta = np.linspace(0, 2 * np.pi, n_segments, endpoint=False)
+    r = 30 + 8 * np.sin(7 * theta) + 3 * np.sin(31 * theta)
+    return list(zip(50 + r * np.cos(theta), 50 + r * np.sin(theta)))
+
+def memory_kb() -> dict[str, int]:
+    '''本进程的常驻内存，分为私有(RssAnon)和共享内存(RssShmem)两部分'''
+    fields = {}
+    for line in Path('/proc/self/status').read_text().splitlines():
+        key, _, value = line.partition(':')
+        if key in ('VmRSS', 'RssAnon', 'RssShmem'): fields[key] = int(value.split()[0])
+    return fields
+
+def _work(source: pd.DataFrame, dest: IDestination) -> tuple[float, dict[str, int]]:
+    started = time.monotonic()
+    dest.distances(source.to_numpy()[:50])
+    return started, memory_kb()
+
+def task_baseline(submitted: float):
+    '''不带数据的空任务，作为工作进程内存的基线'''
+    return time.monotonic() - submitted, memory_kb()
+
+def task_pickled(submitted: float, source: pd.DataFrame, dest: IDestination):
+    started, mem = _work(source, dest)
+    return started - submitted, mem
+
+def task_shared(submitted: float, source_handle, dest_handle):
+    started, mem = _work(attach_points(source_handle), attach_destination(dest_handle))
+    return started - submitted, mem
+
+def run(pool: ProcessPoolExecutor, task, *args) -> tuple[np.ndarray, float, dict[str, int]]:
+    '''逐个提交任务，等上一个完成再提交下一个，这样测到的是纯派发延迟而不含排队'''
+    t_start = time.perf_counter()
+    results = [pool.submit(task, time.monotonic(), *args).result() for _ in range(N_TASKS)]
+    wall = time.perf_counter() - t_start
+    latencies = np.array([lat for lat, _ in results])
+    # 各工作进程最后一次报告的内存里取最大的
+    peak = max((mem for _, mem in results), key=lambda m: m['VmRSS'])
+    return latencies, wall, peak
+
+
+if __name__ == '__main__':
+    n_points = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    n_segments = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    rng = np.random.default_rng(0)
+    source = pd.DataFrame(rng.uniform(0, 100, (n_points, 2)), columns=['x', 'y'])
+    dest = PolylineDestination(traced_outline(n_segments), True, use_index=True)
+    print(f'{n_points} points, {n_segments} segments, '
+          f'{N_TASKS} sequential tasks on {N_WORKERS} workers')
+    print(f"{'mode':>8}{'p50 lat(ms)':>13}{'p95 lat(ms)':>13}{'wall(s)':>9}"
+          f"{'RSS(MB)':>9}{'anon(MB)':>10}{'shmem(MB)':>11}")
+
+    with SharedArrayRegistry() as registry:
+        handles = (registry.publish_points('source', source),
+                   registry.publish_destination('target', dest))
+        for mode, task, args in (('baseline', task_baseline, ()),
+                                 ('pickle', task_pickled, (source, dest)),
+                                 ('shared', task_shared, handles)):
+            # 每种方式用新的进程池，先跑一轮预热，把进程启动开销排除在外；
+            # 用forkserver启动，免得工作进程从父进程继承一份数据，干扰内存的比较
+            with ProcessPoolExecutor(N_WORKERS, mp.get_context('forkserver')) as pool:
+                run(pool, task, *args)
+                latencies, wall, peak = run(pool, task, *args)
+            print(f'{mode:>8}{np.median(latencies) * 1e3:>13.2f}'
+                  f'{np.percentile(latencies, 95) * 1e3:>13.2f}{wall:>9.2f}'
+                  f"{peak['VmRSS'] / 1024:>9.1f}{peak['RssAnon'] / 1024:>10.1f}"
+                  f"{peak['RssShmem'] / 1024:>11.1f}")
@@ -0,0 +1,133 @@
+'''
+作业服务的本机冒烟检查：在随机端口上启动JobService，通过TCP客户端走一遍
+非法请求、找不到源数据集、提交→订阅→完成、取消运行中的作业、运行中和空闲时杀掉工作进程这几条路径。
+    python benchmarks/smoke_service.py
+'''
+
+import asyncio
+import json
+import os
+import signal
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from same_stats.service import DEFAULT_HOST, JobService, request
+
+SHORT_JOB = {'source_path_str': 'datasaurus', 'target_path_str': 'x',
+             'n_iter': 2000, 'n_frames': 2}
+LONG_JOB = {**SHORT_JOB, 'n_iter': 10 ** 7}
+TIMEOUT: float = 120
+
+
+async def call(port: int, payload: dict[str, Any]) -> dict[str, Any]:
+    async for msg in request(payload, DEFAULT_HOST, port):
+        assert msg['ok'], msg
+        return msg
+    raise ConnectionError('服务没有回复')
+
+async def submit(port: int, spec: dict[str, Any]) -> int:
+    return (await call(port, {'op': 'submit', 'spec': spec}))['job']['job_id']
+
+async def events_until(port: int, job_id: int, wanted: str) -> list[dict[str, Any]]:
+    '''订阅作业，收到wanted事件（或作业结束）为止'''
+    events = []
+    async for msg in request({'op': 'watch', 'job_id': job_id}, DEFAULT_HOST, port):
+        events.append(msg)
+        if msg['event'] in (wanted, 'end'): break
+    return events
+
+async def wait_running(port: int, job_id: int) -> int:
+    '''等作业开始汇报进度，返回运行它的工作进程pid'''
+    events = await events_until(port, job_id, 'progress')
+    assert events[-1]['event'] == 'progress', events
+    return [e for e in events if e['event'] == 'started'][-1]['pid']
+
+async def state_of(port: int, job_id: int) -> dict[str, Any]:
+    return (await call(port, {'op': 'status', 'job_id': job_id}))['jobs'][0]
+
+
+async def check_bad_request(port: int) -> None:
+    '''不是JSON对象的请求也要得到一条错误回复，连接处理不能崩'''
+    for line in (b'[1]\n', b'"x"\n'):
+        reader, writer = await asyncio.open_connection(DEFAULT_HOST, port)
+        writer.write(line)
+        await writer.drain()
+        reply = json.loads(await reader.readline())
+        writer.close()
+        assert not reply['ok'], reply
+
+async def check_missing_source(port: int) -> None:
+    '''源数据集在提交时就在服务进程里读入，找不到文件应当直接回复错误'''
+    async for msg in request({'op': 'submit', 'spec': {**SHORT_JOB, 'source_path_str': 'no-such'}},
+                             DEFAULT_HOST, port):
+        assert not msg['ok'], msg
+
+async def check_done(port: int) -> None:
+    job_id = await submit(port, SHORT_JOB)
+    events = await events_until(port, job_id, 'done')
+    assert events[-1]['event'] == 'done', events
+    phases = events[-1]['phases']
+    assert {'setup', 'iterate'} <= set(phases), phases
+
+async def check_cancel(port: int) -> None:
+    job_id = await submit(port, LONG_JOB)
+    await wait_running(port, job_id)
+    await call(port, {'op': 'cancel', 'job_id': job_id})
+    events = await events_until(port, job_id, 'cancelled')
+    assert events[-1]['event'] == 'cancelled', events
+
+async def check_kill_running(port: int) -> None:
+    '''运行中杀掉工作进程：作业应在新进程上重试'''
+    job_id = await submit(port, LONG_JOB)
+    os.kill(await wait_running(port, job_id), signal.SIGKILL)
+    events = await events_until(port, job_id, 'retry')
+    assert events[-1]['event'] == 'retry', events
+    await wait_running(port, job_id)
+    assert (await state_of(port, job_id))['attempts'] == 2
+    await call(port, {'op': 'cancel', 'job_id': job_id})
+    await events_until(port, job_id, 'cancelled')
+
+async def check_kill_idle(service: JobService, port: int) -> None:
+    '''空闲时杀掉工作进程：下一个作业照常完成，且不消耗重试次数'''
+    job_id = await submit(port, SHORT_JOB)
+    pid = await wait_running(port, job_id)
+    await events_until(port, job_id, 'done')
+    os.kill(pid, signal.SIGKILL)
+    await asyncio.sleep(0.5)
+    job_id = await submit(port, SHORT_JOB)
+    events = await events_until(port, job_id, 'done')
+    assert events[-1]['event'] == 'done', events
+    assert (await state_of(port, job_id))['attempts'] == 1
+    assert not any(task.done() for task in service._supervisors)
+    # 所有作业用的是同一份源数据集和目标图形，共享内存里各只放了一份
+    assert len(service.registry.handles) == 2, list(service.registry.handles)
+
+
+async def main() -> None:
+    with tempfile.TemporaryDirectory() as output_home:
+        home = Path(__file__).parent.parent / 'seed_datasets'
+        # 单个工作进程，杀掉它之后下一个作业只能靠补上的新进程
+        service = JobService(1, home, Path(output_home))
+        server = await service.serve(DEFAULT_HOST, 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            for name, check in (
+                ('malformed request', check_bad_request(port)),
+                ('missing source', check_missing_source(port)),
+                ('submit/watch/done', check_done(port)),
+                ('cancel running job', check_cancel(port)),
+                ('kill running worker', check_kill_running(port)),
+                ('kill idle worker', check_kill_idle(service, port)),
+            ):
+                await asyncio.wait_for(check, TIMEOUT)
+                print(f'ok  {name}')
+        finally:
+            server.close()
+            await service.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -5,7 +5,7 @@
 
 from io import BytesIO
 from pathlib import Path
-from typing import Any, Iterator
+from typing import Any, Iterator, Optional
 
 import click
 import pandas as pd
@@ -13,6 +13,7 @@ import tqdm
 
 import same_stats.algo as algo
 from same_stats.utils import (IFileSaver, ILoopIndicator, read_point_csv,
+                              resolve_source_path, resolve_target, target_display_name,
                               run_pattern, create_video)
 
 LAUNCHER_GLOBAL_NAME = '__launcher_config__'
@@ -76,31 +77,42 @@ def do_single_run(
     source_path_str: str, target_path_str: str,
     n_iter: int, n_frames: int, error_precision: int,
     source_home_path: Path, output_home_path: Path,
+    block_size: int = 1,
+    row_selection: str = 'uniform',
+    loop_indicator: Optional[ILoopIndicator] = None,
 ):
+    '''
+    运行一次转换，loop_indicator缺省时使用tqdm进度条
+    block_size大于1时使用块移动模式，每轮迭代同时移动多个点
+    row_selection为'distance'时按到目标的距离加权选点
+    '''
     source_home_path.mkdir(parents=True, exist_ok=True)
-    output_home_path.mkdir(parents=True, exist_ok=True)
 
-    source_path = Path(source_path_str)
-    # 如果输入文件名不是.csv结尾，那么加上这个后缀
-    if source_path.suffix != '.csv':
-        source_path = source_path.with_name(source_path.name + '.csv')
-    # 如果输入文件名是相对路径，那么输入文件名将相对于源搜索目录
-    if not source_path.is_absolute():
-        source_path = source_home_path / source_path
-    if not source_path.is_file():
-        raise ValueError(f'找不到源数据集文件({source_path_str}，扩展为{source_path})')
-    source = read_point_csv(source_path)
-
-    # 目前只在默认的硬编码图形中搜索，文件读取功能有待开发
-    try: target = algo.DEFAULT_DESTS[target_path_str]
-    except KeyError:
-        raise ValueError(f'找不到目标图形({target_path_str})')
-    
+    source_path = resolve_source_path(source_path_str, source_home_path)
+    do_prepared_run(
+        read_point_csv(source_path), source_path.stem,
+        resolve_target(target_path_str), target_display_name(target_path_str),
+        n_iter, n_frames, error_precision, output_home_path,
+        block_size, row_selection, loop_indicator,
+    )
+
+def do_prepared_run(
+    source: pd.DataFrame, source_name: str,
+    target: algo.dest_types.IDestination, target_name: str,
+    n_iter: int, n_frames: int, error_precision: int,
+    output_home_path: Path,
+    block_size: int = 1,
+    row_selection: str = 'uniform',
+    loop_indicator: Optional[ILoopIndicator] = None,
+):
+    '''同do_single_run，但源数据集和目标图形已经由调用者读入'''
+    output_home_path.mkdir(parents=True, exist_ok=True)
     run_pattern(
         source, target,
         n_iter, n_frames, error_precision,
-        DefaultFileSaver(source_path.stem, target_path_str, output_home_path),
-        DefaultLoopIndicator(),
+        DefaultFileSaver(source_name, target_name, output_home_path),
+        DefaultLoopIndicator() if loop_indicator is None else loop_indicator,
+        {'block_size': block_size, 'row_selection': row_selection},
     )
 
 
@@ -111,11 +123,15 @@ if __name__ == '__main__':
     @click.option('--n-iter', type=int, default=100000)
     @click.option('--n-frames', type=int, default=100)
     @click.option('--error-precision', type=int, default=2)
+    @click.option('--block-size', type=int, default=1)
+    @click.option('--row-selection', type=click.Choice(['uniform', 'distance']),
+                  default='uniform')
     @click.option('--source-home', 'source_home_str', type=str, default='seed_datasets')
     @click.option('--output-home', 'output_home_str', type=str, default='results')
     def main(
         source: str, target: str,
         n_iter: int, n_frames: int, error_precision: int,
+        block_size: int, row_selection: str,
         source_home_str: str, output_home_str: str,
     ):
         laucher_config = get_launcher_config()
@@ -125,7 +141,8 @@ if __name__ == '__main__':
         do_single_run(
             source, target,
             n_iter, n_frames, error_precision,
-            Path(source_home_str), Path(output_home_str)
+            Path(source_home_str), Path(output_home_str),
+            block_size, row_selection,
         )
 
     main()
@@ -1,3 +1,4 @@
-from . import dest_types
-from .core import SameStatsTransformation
+from . import dest_loaders, dest_types, sampling
+from .core import SameStatsTransformation, TransformMetrics, mean_distance
 from .default_dests import DEFAULT_DESTS
+from .dest_loaders import load_destination
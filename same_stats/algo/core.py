@@ -1,6 +1,8 @@
+import time
 from typing import Any, Optional
 
 from .dest_types import IDestination
+from .sampling import DistanceWeightedSelector
 from .utils import *
 
 
@@ -12,6 +14,7 @@ def perturb(
     temperature: float,
     shake: float = 0.1,
     allowed_dist: float = 2,
+    row: Optional[int] = None,
 ):
     '''
     This is the function which does one round of perturbation
@@ -23,6 +26,7 @@ def perturb(
     df: 当前数据集
     dest: 目标形状，随便是什么，只要实现IDestination即可
     shake: 每次迭代的最大移动量
+    row: 要扰动的行，缺省时随机均匀地选一行
 
     注：事实上取随机扰动的时候使用的函数是np.random.randn，而这个函数
     生成的是服从标准正态分布的随机数，并没有上下限，也就是说shake只是
@@ -31,11 +35,13 @@ def perturb(
     均匀分布于[0,1)的随机数，这样就符合原作者“shake为最大移动量”的观点，
     但是这样会导致选中的点很容易“卡住”。对此我的评价是：原作者你就是个
     大聪明。
+
+    返回值：(被选中的行号, 新位置, 新位置到目标的距离, 生成候选点的次数)
     '''
 
     # take one row at random
     # 随机取一行
-    row = np.random.randint(0, len(df))
+    if row is None: row = np.random.randint(0, len(df))
     point = df_get_ith_point(df, row)
 
     # this is the simulated annealing step, if "do_bad", then we are willing to 
@@ -45,7 +51,9 @@ def perturb(
     do_bad = np.random.random_sample() < temperature
 
     op_success = False
+    n_tries = 0
     while not op_success:
+        n_tries += 1
         new_point = shake_point(point, shake)
 
         # 此处距离的计算委托给具体的实现
@@ -65,7 +73,61 @@ def perturb(
         pos_acceptable = point_in_bound(new_point, x_bounds, y_bounds)
         op_success = dist_acceptable and pos_acceptable
 
-    return row, new_point
+    return row, new_point, new_dist, n_tries
+
+
+def perturb_block(
+    points: np.ndarray,
+    rows: np.ndarray,
+    dest: IDestination,
+    x_bounds: Bound,
+    y_bounds: Bound,
+    temperature: float,
+    shake: float = 0.1,
+    allowed_dist: float = 2,
+):
+    '''
+    perturb的向量化版本：对rows中的每个点各自独立地做一次扰动，
+    接受条件与perturb完全相同，没被接受的点继续重新生成，直到全部通过
+
+    返回值：(新位置数组, 新位置到目标的距离, 各点到目标距离的减少量, 生成候选点的总次数)
+    '''
+    old = points[rows]
+    old_dist = dest.distances(old)
+    do_bad = np.random.random_sample(len(rows)) < temperature
+    (xmin, xmax), (ymin, ymax) = x_bounds, y_bounds
+
+    new = np.empty_like(old)
+    new_dist = np.empty(len(rows))
+    pending = np.arange(len(rows))
+    n_tries = 0
+    while len(pending):
+        n_tries += len(pending)
+        cand = old[pending] + np.random.randn(len(pending), 2) * shake
+        cand_dist = dest.distances(cand)
+        dist_acceptable = (cand_dist < old_dist[pending]) | (cand_dist < allowed_dist) \
+            | do_bad[pending]
+        pos_acceptable = (cand[:, 0] > xmin) & (cand[:, 0] < xmax) \
+            & (cand[:, 1] > ymin) & (cand[:, 1] < ymax)
+        ok = dist_acceptable & pos_acceptable
+        new[pending[ok]] = cand[ok]
+        new_dist[pending[ok]] = cand_dist[ok]
+        pending = pending[~ok]
+
+    return new, new_dist, old_dist - new_dist, n_tries
+
+
+def sample_distinct_rows(n: int, k: int) -> np.ndarray:
+    '''
+    从n行里均匀地选k个不同的行。
+    np.random.choice(replace=False)每次都要打乱全部n个下标，k远小于n时
+    改为有放回地抽、去掉重复再补抽，代价只与k有关
+    '''
+    if 2 * k > n: return np.random.choice(n, k, replace=False)
+    rows = np.unique(np.random.randint(0, n, k))
+    while len(rows) < k:
+        rows = np.union1d(rows, np.random.randint(0, n, k - len(rows)))
+    return rows
 
 
 def is_error_still_ok(stats1: DFStats, stats2: DFStats, n_decimal_trunc: int):
@@ -82,8 +144,101 @@ def is_error_still_ok(stats1: DFStats, stats2: DFStats, n_decimal_trunc: int):
     return max(error) == 0
 
 
+def mean_distance(df: pd.DataFrame, dest: IDestination) -> float:
+    '''数据集中所有点到目标图形的平均距离，用来衡量拟合程度'''
+    return float(dest.distances(df.to_numpy(dtype=float)).mean())
+
+
+BLOCK_POLICIES = ('all', 'greedy')
+ROW_SELECTIONS = ('uniform', 'distance')
+# 每提交这么多次就从点集重算一次充分统计量，消除增量更新积累的误差
+MOMENT_RESYNC_INTERVAL: int = 1000
+
+
+class TransformMetrics:
+    '''迭代过程的计数统计'''
+
+    n_iters: int
+    n_accepted: int
+    n_proposals: int
+    n_point_moves: int
+    elapsed: float
+    n_prefilter_decided: int
+    n_exact_checks: int
+
+    def __init__(self) -> None:
+        self.n_iters = 0
+        # 通过统计检查、真正生效的迭代数
+        self.n_accepted = 0
+        # perturb中生成候选点的总次数，包括被距离/边界条件拒绝的空转
+        self.n_proposals = 0
+        # 真正生效的单点移动数，单点模式下与n_accepted相同
+        self.n_point_moves = 0
+        # iterate累计耗时（秒）
+        self.elapsed = 0.0
+        # 由余量预判直接定下接受与否的统计检查数
+        self.n_prefilter_decided = 0
+        # 离取整边界太近、交给pandas精确检查的次数
+        self.n_exact_checks = 0
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.n_accepted / self.n_iters if self.n_iters else 0.0
+
+    @property
+    def proposals_per_iter(self) -> float:
+        return self.n_proposals / self.n_iters if self.n_iters else 0.0
+
+    @property
+    def iters_per_sec(self) -> float:
+        return self.n_iters / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def point_moves_per_sec(self) -> float:
+        '''等效的单点移动速率，用来和单点模式比较'''
+        return self.n_point_moves / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def prefilter_rate(self) -> float:
+        '''经过统计检查的提议中由余量预判单独决定的比例'''
+        n_checked = self.n_prefilter_decided + self.n_exact_checks
+        return self.n_prefilter_decided / n_checked if n_checked else 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        return {
+            'n_iters': self.n_iters,
+            'n_accepted': self.n_accepted,
+            'n_proposals': self.n_proposals,
+            'n_point_moves': self.n_point_moves,
+            'elapsed': self.elapsed,
+            'acceptance_rate': self.acceptance_rate,
+            'proposals_per_iter': self.proposals_per_iter,
+            'iters_per_sec': self.iters_per_sec,
+            'point_moves_per_sec': self.point_moves_per_sec,
+            'n_prefilter_decided': self.n_prefilter_decided,
+            'n_exact_checks': self.n_exact_checks,
+            'prefilter_rate': self.prefilter_rate,
+        }
+
+
 class SameStatsTransformation:
-    '''算法主类。'''
+    '''
+    算法主类。
+
+    block_size大于1时进入块移动模式：每轮迭代随机选block_size个不同的点，
+    用numpy一起扰动，再用充分统计量O(1)地算出整体移动后的统计数字。
+    block_policy为'all'时整块要么全部接受要么全部撤销；为'greedy'时按
+    离目标改善从多到少逐个试加，保留能通过统计检查的最大子集
+
+    row_selection为'distance'时，按各点到目标的当前距离加权选点，
+    并以selection_floor的概率退回均匀选点；已经贴在目标上的点就少被挑中
+
+    prefilter为真时，先用充分统计量和各统计数字的取整余量预判：
+    单点模式下均值的余量换算成位移范围，超出的直接拒绝；其余的O(1)算出
+    新统计数字，离取整边界足够远的直接定夺，只有贴着边界的才用pandas
+    精确检查，判定结果与不开预判时完全一致。块移动模式同样只在贴着边界时
+    用pandas检查；prefilter为假时每次都用pandas检查
+    '''
 
     source: pd.DataFrame
     cur_state: pd.DataFrame
@@ -96,6 +251,11 @@ class SameStatsTransformation:
     temperature_range: tuple[float, float]
     n_error_trunc: int
     perturb_params: dict[str, Any]
+    block_size: int
+    block_policy: str
+    selector: Optional[DistanceWeightedSelector]
+    slack: Optional[StatSlack]
+    metrics: TransformMetrics
 
     def __init__(self,
         source: pd.DataFrame,
@@ -106,7 +266,18 @@ class SameStatsTransformation:
         temperature_range: tuple[float, float] = (0.0, 0.4),
         n_error_trunc: int = 2,
         perturb_params: Optional[dict[str, Any]] = None,
+        block_size: int = 1,
+        block_policy: str = 'greedy',
+        row_selection: str = 'uniform',
+        selection_floor: float = 0.1,
+        prefilter: bool = True,
     ) -> None:
+        if not 1 <= block_size <= len(source):
+            raise ValueError(f'块大小({block_size})应在1到点数之间')
+        if block_policy not in BLOCK_POLICIES:
+            raise ValueError(f'未知的块接受策略({block_policy})')
+        if row_selection not in ROW_SELECTIONS:
+            raise ValueError(f'未知的选点方式({row_selection})')
         xmin, xmax = x_bounds
         ymin, ymax = y_bounds
         source = source.clip([xmin, ymin], [xmax, ymax]) # type: ignore
@@ -119,11 +290,25 @@ class SameStatsTransformation:
         self.temperature_range = temperature_range
         self.n_error_trunc = n_error_trunc
         self.perturb_params = {} if perturb_params is None else perturb_params
+        self.block_size = block_size
+        self.block_policy = block_policy
 
         self.cur_iter = 0
         # 备份源状态，虽然我也不知道有什么用
         self.cur_state = source.copy()
         self.cur_stats = df_stats(source)
+        self.metrics = TransformMetrics()
+        self.selector = None
+        if row_selection == 'distance':
+            distances = target.distances(source.to_numpy(dtype=float))
+            self.selector = DistanceWeightedSelector(distances, selection_floor)
+        # 块移动模式和单点预判都在numpy数组上工作，提交时再同步到cur_state
+        self._points = source.to_numpy(dtype=float, copy=True)
+        self._moments = MomentSums(self._points)
+        self._n_commits = 0
+        # 接受的状态与源数据集的取整结果始终相同，所以余量区间是固定的
+        self.slack = StatSlack(self.cur_stats, n_error_trunc) if prefilter else None
+        self._shift_bounds = self._current_shift_bounds()
 
     @property
     def temperature(self) -> float:
@@ -133,22 +318,136 @@ class SameStatsTransformation:
     
     def iterate(self) -> bool:
         '''做一轮迭代，如果已完成全部迭代，返回真。'''
-        target_row, new_point = perturb(self.cur_state, self.target,
+        t_start = time.perf_counter()
+        if self.block_size > 1: self._iterate_block()
+        else: self._iterate_single()
+        self.cur_iter += 1
+        self.metrics.n_iters += 1
+        self.metrics.elapsed += time.perf_counter() - t_start
+        return self.cur_iter >= self.total_iters
+
+    def _iterate_single(self) -> None:
+        row = None if self.selector is None else self.selector.sample()
+        target_row, new_point, new_dist, n_tries = perturb(self.cur_state, self.target,
                                         self.x_bounds, self.y_bounds,
                                         self.temperature,
-                                        **self.perturb_params)
-        orig_point = df_get_ith_point(self.cur_state, target_row)
+                                        **self.perturb_params, row=row)
+        self.metrics.n_proposals += n_tries
+        orig_point = cast(Point, tuple(self._points[target_row]))
+
+        verdict = None
+        if self.slack is not None:
+            delta = self._moments.move_delta(orig_point, new_point)
+            verdict = self._prefilter(orig_point, new_point, delta)
+        if verdict is False:
+            # 拒绝时数据集一点都没动过
+            self.metrics.n_prefilter_decided += 1
+            return
 
         # 这样就不用每次都复制整个源数据集，或许能提高效率
         df_set_ith_point(self.cur_state, target_row, new_point)
-        new_stats = df_stats(self.cur_state)
+        if verdict is True:
+            self.metrics.n_prefilter_decided += 1
+            new_stats = self._moments.stats(delta)
+        else:
+            self.metrics.n_exact_checks += 1
+            new_stats = df_stats(self.cur_state)
+            if not is_error_still_ok(self.cur_stats, new_stats, self.n_error_trunc):
+                # 撤销本次扰动
+                df_set_ith_point(self.cur_state, target_row, orig_point)
+                return
+
+        self.cur_stats = new_stats
+        self._points[target_row] = new_point
+        if self.slack is not None:
+            self._moments.sums += delta
+            self._count_commit()
+            self._shift_bounds = self._current_shift_bounds()
+        self.metrics.n_accepted += 1
+        self.metrics.n_point_moves += 1
+        if self.selector is not None:
+            self.selector.update(target_row, new_dist)
+
+    def _current_shift_bounds(self) -> Optional[tuple[Bound, Bound]]:
+        if self.slack is None: return None
+        n = self._moments.n
+        su, sv = self._moments.sums[:2]
+        mean = (self._moments.center[0] + su / n, self._moments.center[1] + sv / n)
+        return self.slack.shift_bounds(n, mean)
+
+    def _prefilter(self, orig_point: Point, new_point: Point,
+                   delta: np.ndarray) -> Optional[bool]:
+        '''余量预判，返回值同StatSlack.classify'''
+        assert self.slack is not None and self._shift_bounds is not None
+        (dx_lo, dx_hi), (dy_lo, dy_hi) = self._shift_bounds
+        dx = new_point[0] - orig_point[0]
+        dy = new_point[1] - orig_point[1]
+        if not (dx_lo <= dx <= dx_hi and dy_lo <= dy <= dy_hi): return False
+        return self.slack.classify(self._moments.stats(delta))
 
-        if is_error_still_ok(self.cur_stats, new_stats, self.n_error_trunc):
-            self.cur_stats = new_stats
+    def _count_commit(self) -> None:
+        self._n_commits += 1
+        if self._n_commits % MOMENT_RESYNC_INTERVAL == 0:
+            self._moments.resync(self._points)
+
+    def _check_block(self, delta: np.ndarray, rows: np.ndarray,
+                     new_points: np.ndarray) -> Optional[DFStats]:
+        '''
+        把rows移到new_points后统计数字是否仍然合格，合格时返回新的统计数字。
+        先按余量预判，贴着取整边界的再用pandas在移动后的点集上精确检查
+        '''
+        new_stats = self._moments.stats(delta)
+        verdict = None if self.slack is None else self.slack.classify(new_stats)
+        if verdict is not None:
+            self.metrics.n_prefilter_decided += 1
+            return new_stats if verdict else None
+        self.metrics.n_exact_checks += 1
+        points = self._points.copy()
+        points[rows] = new_points
+        new_stats = df_stats(pd.DataFrame(points, columns=['x', 'y']))
+        ok = is_error_still_ok(self.cur_stats, new_stats, self.n_error_trunc)
+        return new_stats if ok else None
+
+    def _iterate_block(self) -> None:
+        if self.selector is None:
+            rows = sample_distinct_rows(len(self._points), self.block_size)
         else:
-            # 撤销本次扰动
-            df_set_ith_point(self.cur_state, target_row, orig_point)
-        
-        self.cur_iter += 1
-        return self.cur_iter >= self.total_iters
+            rows = self.selector.sample_distinct(self.block_size)
+        new_points, new_dists, gains, n_tries = perturb_block(
+            self._points, rows, self.target, self.x_bounds, self.y_bounds,
+            self.temperature, **self.perturb_params)
+        self.metrics.n_proposals += n_tries
+        deltas = self._moments.contributions(new_points) \
+            - self._moments.contributions(self._points[rows])
+
+        total = deltas.sum(axis=0)
+        new_stats = self._check_block(total, rows, new_points)
+        if new_stats is not None:
+            keep = np.arange(len(rows))
+        elif self.block_policy == 'greedy':
+            # 离目标改善最多的先试，能加就加
+            kept: list[int] = []
+            total = np.zeros_like(total)
+            for i in np.argsort(-gains):
+                trial = kept + [i]
+                stats = self._check_block(total + deltas[i], rows[trial], new_points[trial])
+                if stats is not None:
+                    total = total + deltas[i]
+                    kept = trial
+                    new_stats = stats
+            keep = np.array(kept, dtype=int)
+        else:
+            keep = np.array([], dtype=int)
+        if new_stats is None or len(keep) == 0: return
+
+        self._points[rows[keep]] = new_points[keep]
+        self._moments.sums += total
+        self._count_commit()
+        self.cur_stats = new_stats
+        self.cur_state.iloc[rows[keep], :] = new_points[keep]
+        if self.selector is not None:
+            for row, dist in zip(rows[keep], new_dists[keep]):
+                self.selector.update(int(row), float(dist))
+        self.metrics.n_accepted += 1
+        self.metrics.n_point_moves += len(keep)
 
@@ -0,0 +1,249 @@
+import json
+import re
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Any, Optional
+
+from .dest_types import LineShapeDestination
+from .utils import *
+
+# (折线顶点, 是否首尾相连)
+Polyline = tuple[list[Point], bool]
+
+# 贝塞尔曲线展平时每段曲线切成的线段数
+CURVE_SEGMENTS: int = 16
+# 拟合到坐标范围时四周留出的比例
+FIT_MARGIN: float = 0.1
+
+SUPPORTED_SUFFIXES = ('.csv', '.json', '.svg')
+
+
+def load_polylines_csv(pth: str | Path) -> list[Polyline]:
+    '''
+    读入csv折线
+    带表头时需有x、y两列，可选的path列用来区分不同折线；
+    无表头时两列为x、y，三列时第一列为折线编号
+    '''
+    df = pd.read_csv(pth)
+    if not {'x', 'y'} <= set(df.columns):
+        df = pd.read_csv(pth, header=None)
+        if df.shape[1] == 2: df.columns = ['x', 'y']
+        elif df.shape[1] == 3: df.columns = ['path', 'x', 'y']
+        else: raise ValueError('数据列数不正确')
+    if 'path' not in df.columns:
+        return [(list(zip(df.x.astype(float), df.y.astype(float))), False)]
+    return [(list(zip(g.x.astype(float), g.y.astype(float))), False)
+            for _, g in df.groupby('path', sort=False)]
+
+def is_real(x: Any) -> bool:
+    return isinstance(x, (int, float)) and not isinstance(x, bool)
+
+def _json_polyline(obj: Any, closed: bool) -> Polyline:
+    if isinstance(obj, dict):
+        return _json_polyline(obj['points'], obj.get('closed', closed))
+    return ([(float(x), float(y)) for x, y in obj], closed)
+
+def load_polylines_json(pth: str | Path) -> list[Polyline]:
+    '''
+    读入json折线，支持以下几种写法：
+        [[x, y], ...]                          单条折线
+        [[[x, y], ...], ...]                   多条折线
+        {"polylines": [...], "closed": true}   折线可以写成{"points": [...], "closed": ...}
+    '''
+    data = json.loads(Path(pth).read_text(encoding='utf-8'))
+    closed = False
+    if isinstance(data, dict):
+        closed = data.get('closed', False)
+        data = data['polylines']
+    if not data: raise ValueError('折线为空')
+    # 第一个元素是坐标对，说明整个列表是单条折线
+    first = data[0]
+    if isinstance(first, list) and len(first) == 2 and all(is_real(v) for v in first):
+        return [_json_polyline(data, closed)]
+    return [_json_polyline(pl, closed) for pl in data]
+
+
+_SVG_TOKEN = re.compile(r'[MmLlHhVvCcSsQqTtZzAa]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+def _bezier(ctrl: list[Point], n: int) -> list[Point]:
+    '''展平贝塞尔曲线，返回不含起点的n个点'''
+    ts = np.linspace(0, 1, n + 1)[1:, None, None]
+    pts = np.broadcast_to(np.array(ctrl, dtype=float), (n, len(ctrl), 2))
+    # de Casteljau算法，所有t一起算
+    while pts.shape[1] > 1:
+        pts = pts[:, :-1] * (1 - ts) + pts[:, 1:] * ts
+    return [(float(x), float(y)) for x, y in pts[:, 0]]
+
+def parse_svg_path(d: str) -> list[Polyline]:
+    '''
+    解析svg path的d属性
+    支持M/L/H/V/C/S/Q/T/Z（含相对坐标形式），曲线按CURVE_SEGMENTS展平；
+    不支持圆弧A
+    '''
+    tokens = _SVG_TOKEN.findall(d)
+    polylines: list[Polyline] = []
+    cur: list[Point] = []
+    pos = start = (0.0, 0.0)
+    last_ctrl: Optional[Point] = None
+    last_cmd = ''
+    cmd = ''
+    i = 0
+
+    def take(n: int) -> list[float]:
+        nonlocal i
+        vals = tokens[i:i + n]
+        if len(vals) < n or any(v.isalpha() for v in vals):
+            raise ValueError(f'svg路径参数不足({d[:40]})')
+        i += n
+        return [float(v) for v in vals]
+
+    def flush(closed: bool) -> None:
+        nonlocal cur
+        if len(cur) >= 2: polylines.append((cur, closed))
+        cur = []
+
+    while i < len(tokens):
+        if tokens[i].isalpha():
+            cmd = tokens[i]; i += 1
+        elif not cmd:
+            raise ValueError(f'svg路径必须以命令开头({d[:40]})')
+        rel = cmd.islower()
+        ox, oy = pos if rel else (0.0, 0.0)
+        c = cmd.upper()
+
+        if c == 'Z':
+            flush(True)
+            pos = start
+            last_ctrl = None
+            last_cmd = c
+            cmd = ''
+            continue
+        if c == 'M':
+            x, y = take(2)
+            flush(False)
+            pos = start = (ox + x, oy + y)
+            cur = [pos]
+            # M之后的隐式坐标按L处理
+            cmd = 'l' if rel else 'L'
+            last_ctrl = None
+            last_cmd = c
+            continue
+        if not cur: cur = [pos]
+
+        if c == 'L':
+            x, y = take(2); new_points = [(ox + x, oy + y)]; last_ctrl = None
+        elif c == 'H':
+            x, = take(1); new_points = [(ox + x if rel else x, pos[1])]; last_ctrl = None
+        elif c == 'V':
+            y, = take(1); new_points = [(pos[0], oy + y if rel else y)]; last_ctrl = None
+        elif c in 'CS':
+            if c == 'C':
+                x1, y1, x2, y2, x, y = take(6); c1 = (ox + x1, oy + y1)
+            else:
+                x2, y2, x, y = take(4)
+                c1 = pos if last_ctrl is None or last_cmd not in 'CS' else \
+                    (2 * pos[0] - last_ctrl[0], 2 * pos[1] - last_ctrl[1])
+            c2 = (ox + x2, oy + y2); end = (ox + x, oy + y)
+            new_points = _bezier([pos, c1, c2, end], CURVE_SEGMENTS)
+            last_ctrl = c2
+        elif c in 'QT':
+            if c == 'Q':
+                x1, y1, x, y = take(4); c1 = (ox + x1, oy + y1)
+            else:
+                x, y = take(2)
+                c1 = pos if last_ctrl is None or last_cmd not in 'QT' else \
+                    (2 * pos[0] - last_ctrl[0], 2 * pos[1] - last_ctrl[1])
+            end = (ox + x, oy + y)
+            new_points = _bezier([pos, c1, end], CURVE_SEGMENTS)
+            last_ctrl = c1
+        else:
+            raise ValueError(f'不支持的svg路径命令({cmd})')
+        cur.extend(new_points)
+        pos = new_points[-1]
+        last_cmd = c
+    flush(False)
+    return polylines
+
+def _svg_points(attr: str) -> list[Point]:
+    vals = [float(v) for v in re.split(r'[\s,]+', attr.strip()) if v]
+    return list(zip(vals[0::2], vals[1::2]))
+
+def load_polylines_svg(pth: str | Path) -> list[Polyline]:
+    '''
+    读入svg中的path/polyline/polygon/line元素
+    不处理transform等属性，复杂的svg请先在编辑器里“拍平”
+    '''
+    root = ET.parse(pth).getroot()
+    polylines: list[Polyline] = []
+    for el in root.iter():
+        tag = el.tag.rsplit('}', 1)[-1]
+        if tag == 'path' and el.get('d'):
+            polylines.extend(parse_svg_path(el.get('d', '')))
+        elif tag in ('polyline', 'polygon') and el.get('points'):
+            polylines.append((_svg_points(el.get('points', '')), tag == 'polygon'))
+        elif tag == 'line':
+            p1 = (float(el.get('x1', 0)), float(el.get('y1', 0)))
+            p2 = (float(el.get('x2', 0)), float(el.get('y2', 0)))
+            polylines.append(([p1, p2], False))
+    if not polylines: raise ValueError(f'svg中没有可用的图形({pth})')
+    return polylines
+
+
+def fit_polylines(
+    polylines: list[Polyline], x_bounds: Bound, y_bounds: Bound,
+    flip_y: bool = False, margin: float = FIT_MARGIN,
+) -> list[Polyline]:
+    '''等比缩放并平移折线，使其居中放进给定的坐标范围；flip_y用于svg这种y轴朝下的坐标系'''
+    pts = np.array([p for pl, _ in polylines for p in pl], dtype=float)
+    if flip_y: pts[:, 1] = -pts[:, 1]
+    lo = pts.min(axis=0); hi = pts.max(axis=0)
+    (xmin, xmax), (ymin, ymax) = x_bounds, y_bounds
+    box = np.array([xmax - xmin, ymax - ymin]) * (1 - 2 * margin)
+    extent = hi - lo
+    scale = min(box[extent > 0] / extent[extent > 0], default=1.0)
+    center = np.array([(xmin + xmax) / 2, (ymin + ymax) / 2])
+    offset = center - (lo + hi) / 2 * scale
+
+    fitted: list[Polyline] = []
+    for pl, closed in polylines:
+        arr = np.array(pl, dtype=float)
+        if flip_y: arr[:, 1] = -arr[:, 1]
+        arr = arr * scale + offset
+        fitted.append(([(float(x), float(y)) for x, y in arr], closed))
+    return fitted
+
+def polylines_to_destination(polylines: list[Polyline]) -> LineShapeDestination:
+    '''把若干折线合并成一个线段目标图形，线段多时会自动建立网格索引'''
+    lines: list[Line] = []
+    for pl, closed in polylines:
+        if len(pl) == 1: lines.append((pl[0], pl[0]))
+        lines.extend((pl[i], pl[i + 1]) for i in range(len(pl) - 1))
+        if closed and len(pl) > 2: lines.append((pl[-1], pl[0]))
+    if not lines: raise ValueError('折线为空')
+    return LineShapeDestination(lines)
+
+def load_destination(
+    pth: str | Path,
+    fit_bounds: Optional[tuple[Bound, Bound]] = None,
+) -> LineShapeDestination:
+    '''
+    从csv/json/svg文件读入目标图形
+    fit_bounds给出时，图形会被等比缩放到该坐标范围内；svg坐标系与数据坐标系
+    毫无关系，因此svg总是会被翻转y轴并缩放，fit_bounds缺省时使用(0, 100)
+    '''
+    pth = Path(pth)
+    suffix = pth.suffix.lower()
+    if suffix == '.csv':
+        polylines = load_polylines_csv(pth)
+    elif suffix == '.json':
+        polylines = load_polylines_json(pth)
+    elif suffix == '.svg':
+        polylines = load_polylines_svg(pth)
+        if fit_bounds is None: fit_bounds = ((0, 100), (0, 100))
+        polylines = fit_polylines(polylines, *fit_bounds, flip_y=True)
+        fit_bounds = None
+    else:
+        raise ValueError(f'不支持的目标图形文件格式({pth.suffix})')
+    if fit_bounds is not None:
+        polylines = fit_polylines(polylines, *fit_bounds)
+    return polylines_to_destination(polylines)
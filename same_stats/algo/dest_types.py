@@ -1,8 +1,13 @@
 import abc
 import itertools
+from typing import Optional
 
+from .spatial import SegmentGrid
 from .utils import *
 
+# 线段数不少于此值时，LineShapeDestination自动建立网格索引
+SEGMENT_INDEX_THRESHOLD: int = 64
+
 
 class IDestination(abc.ABC):
     '''目标图形接口'''
@@ -12,6 +17,13 @@ class IDestination(abc.ABC):
         '''求某点到该图形的最短距离'''
         raise NotImplementedError
 
+    def distances(self, points: np.ndarray) -> np.ndarray:
+        '''
+        一次求多个点（形状为(n, 2)的数组）到该图形的最短距离
+        默认逐点调用distance，子类可以提供向量化的实现
+        '''
+        return np.array([self.distance((x, y)) for x, y in points], dtype=float)
+
 
 class ConcentricCirclesDestination(IDestination):
     '''同心圆目标图形'''
@@ -27,6 +39,10 @@ class ConcentricCirclesDestination(IDestination):
         dis = point_distance(point, self.center)
         return min(abs(dis - r) for r in self.radius_list)
 
+    def distances(self, points: np.ndarray) -> np.ndarray:
+        dis = np.hypot(points[:, 0] - self.center[0], points[:, 1] - self.center[1])
+        return np.abs(dis[:, None] - np.array(self.radius_list)).min(axis=1)
+
 
 class GridPointsDestination(IDestination):
     '''网格点目标图形'''
@@ -42,25 +58,66 @@ class GridPointsDestination(IDestination):
         return min(point_distance(point, gridp)
                    for gridp in itertools.product(self.xs, self.ys))
 
+    def distances(self, points: np.ndarray) -> np.ndarray:
+        dx = np.abs(points[:, :1] - np.array(self.xs)).min(axis=1)
+        dy = np.abs(points[:, 1:] - np.array(self.ys)).min(axis=1)
+        return np.hypot(dx, dy)
+
 
 class LineShapeDestination(IDestination):
     '''线段组成的目标图形'''
 
-    lines: list[Line]
-
-    def __init__(self, lines: list[Line]) -> None:
-        self.lines = lines
+    segments: np.ndarray
+    index: Optional[SegmentGrid]
+
+    def __init__(self, lines: list[Line], use_index: Optional[bool] = None) -> None:
+        '''
+        use_index为None时，线段数达到SEGMENT_INDEX_THRESHOLD才建立网格索引；
+        线段少的时候逐条计算反而更快
+        '''
+        self._lines: Optional[list[Line]] = lines
+        self.segments = np.array(lines, dtype=float).reshape(-1, 4)
+        if use_index is None: use_index = len(lines) >= SEGMENT_INDEX_THRESHOLD
+        self.index = SegmentGrid(self.segments) if use_index else None
+
+    @classmethod
+    def from_index(cls, index: SegmentGrid) -> 'LineShapeDestination':
+        '''用已经建好的网格索引构造，线段数组与索引共用'''
+        dest = cls.__new__(cls)
+        dest.segments = index.segments
+        # 有索引时用不到lines，不必在每个进程里把共享的线段数组再展开一遍
+        dest._lines = None
+        dest.index = index
+        return dest
+
+    @property
+    def lines(self) -> list[Line]:
+        '''线段列表，用到时才从segments展开'''
+        if self._lines is None:
+            self._lines = [((x1, y1), (x2, y2))
+                           for x1, y1, x2, y2 in self.segments.tolist()]
+        return self._lines
     
     def distance(self, point: Point) -> float:
+        if self.index is not None: return self.index.distance(point)
         return min(point_line_distance(point, l) for l in self.lines)
 
+    def distances(self, points: np.ndarray) -> np.ndarray:
+        if self.index is not None: return self.index.distances(points)
+        # 线段不多，直接算出点-线段距离矩阵
+        dist = points_segments_distance((points[:, :1], points[:, 1:]), self.segments)
+        return dist.min(axis=1)
+
 
 class PolylineDestination(LineShapeDestination):
     '''折线/多边形目标图形'''
 
-    def __init__(self, points: list[Point], connect_polygon: bool = False) -> None:
+    def __init__(self,
+        points: list[Point], connect_polygon: bool = False,
+        use_index: Optional[bool] = None,
+    ) -> None:
         '''当connect_polygon为真，折线会首尾相连形成多边形'''
         if len(points) < 3: raise ValueError
         lines = [(points[i], points[i+1]) for i in range(len(points) - 1)]
         if connect_polygon: lines.append((points[-1], points[0]))
-        super().__init__(lines)
+        super().__init__(lines, use_index)
@@ -0,0 +1,120 @@
+from .utils import *
+
+# 累计这么多次更新后重建树，防止增量更新的舍入误差越积越多
+REBUILD_INTERVAL: int = 100000
+
+
+class SumTree:
+    '''
+    树状数组（Fenwick树），支持O(log n)的单点修改和按前缀和查找，
+    用于按权重抽样
+    '''
+
+    weights: np.ndarray
+    tree: list[float]
+    n_updates: int
+
+    def __init__(self, weights: np.ndarray) -> None:
+        self.rebuild(np.asarray(weights, dtype=float))
+
+    def rebuild(self, weights: np.ndarray) -> None:
+        if (weights < 0).any(): raise ValueError('权重不能为负')
+        self.weights = weights.copy()
+        n = len(weights)
+        tree = [0.0] * (n + 1)
+        for i in range(1, n + 1):
+            tree[i] += float(weights[i - 1])
+            parent = i + (i & -i)
+            if parent <= n: tree[parent] += tree[i]
+        self.tree = tree
+        self.n_updates = 0
+
+    def __len__(self) -> int:
+        return len(self.weights)
+
+    @property
+    def total(self) -> float:
+        '''全部权重之和'''
+        s = 0.0
+        i = len(self.weights)
+        while i > 0:
+            s += self.tree[i]
+            i -= i & -i
+        return s
+
+    def update(self, i: int, weight: float) -> None:
+        '''把第i个权重改为weight'''
+        delta = weight - float(self.weights[i])
+        self.weights[i] = weight
+        n = len(self.weights)
+        j = i + 1
+        while j <= n:
+            self.tree[j] += delta
+            j += j & -j
+        self.n_updates += 1
+        if self.n_updates >= REBUILD_INTERVAL: self.rebuild(self.weights)
+
+    def find(self, u: float) -> int:
+        '''
+        找到满足 前i项和 <= u < 前i+1项和 的i，
+        u在[0, total)中均匀分布时，i被选中的概率正比于其权重
+        '''
+        n = len(self.weights)
+        pos = 0
+        step = 1 << n.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= n and self.tree[nxt] <= u:
+                pos = nxt
+                u -= self.tree[nxt]
+            step >>= 1
+        # 舍入误差可能让u落在total之外，此时退回最后一个正权重
+        if pos >= n: pos = int(np.flatnonzero(self.weights > 0)[-1])
+        return pos
+
+
+class DistanceWeightedSelector:
+    '''
+    按各点到目标图形的当前距离加权选点。
+    以floor的概率改为均匀选点，保证每个点总有机会被选中，过程仍然遍历。
+    距离只在点的移动被提交时更新。
+    '''
+
+    tree: SumTree
+    floor: float
+
+    def __init__(self, distances: np.ndarray, floor: float = 0.1) -> None:
+        if not 0 <= floor <= 1: raise ValueError(f'混合比例({floor})应在0到1之间')
+        self.tree = SumTree(distances)
+        self.floor = floor
+
+    @property
+    def mean_distance(self) -> float:
+        '''所有点到目标的平均距离，O(log n)'''
+        return self.tree.total / len(self.tree)
+
+    def sample(self) -> int:
+        n = len(self.tree)
+        total = self.tree.total
+        if total <= 0 or np.random.random_sample() < self.floor:
+            return np.random.randint(0, n)
+        return self.tree.find(np.random.random_sample() * total)
+
+    def sample_distinct(self, k: int) -> np.ndarray:
+        '''不放回地选k个不同的点'''
+        rows: list[int] = []
+        saved: list[tuple[int, float]] = []
+        chosen: set[int] = set()
+        while len(rows) < k:
+            row = self.sample()
+            if row in chosen: continue
+            chosen.add(row)
+            rows.append(row)
+            # 暂时把已选中的点的权重清零，免得加权部分反复抽到它
+            saved.append((row, float(self.tree.weights[row])))
+            self.tree.update(row, 0.0)
+        for row, weight in saved: self.tree.update(row, weight)
+        return np.array(rows)
+
+    def update(self, row: int, distance: float) -> None:
+        self.tree.update(row, distance)
@@ -0,0 +1,211 @@
+import math
+from typing import Any, Optional
+
+from .utils import *
+
+# 批量查询时每次处理的点数，限制展开的(点, 候选线段)对占用的内存
+QUERY_BATCH: int = 1024
+
+
+class SegmentGrid:
+    '''
+    线段的均匀网格索引，用于加速“点到最近线段”的查询。
+    每条线段只登记在它实际穿过的格子里（长斜线段不会占满整个包围盒）。查询时扫描以点所在格子为
+    中心、半宽为K格的方块：方块外的线段离点至少K个格子宽，所以若已知
+    最短距离不超过这个值就可以停下，否则按已知最短距离放大方块再扫一次。
+
+    格子以CSR形式存储：第c个格子中的线段编号为
+    cell_items[cell_ptr[c]:cell_ptr[c+1]]，格子编号c = iy * nx + ix。
+    同一行相邻的格子在cell_items中也是相邻的，所以方块的每一行都是一段
+    连续切片。empty_rings[c]为格子c周围保证为空的圈数，用来确定初始的K。
+    '''
+
+    segments: np.ndarray
+    origin: tuple[float, float]
+    cell_size: float
+    nx: int
+    ny: int
+    cell_ptr: np.ndarray
+    cell_items: np.ndarray
+    empty_rings: np.ndarray
+
+    def __init__(self, segments: np.ndarray, cell_size: Optional[float] = None) -> None:
+        '''cell_size缺省时让格子数与线段数大致相当'''
+        segments = np.asarray(segments, dtype=float).reshape(-1, 4)
+        if len(segments) == 0: raise ValueError('线段不能为空')
+        self.segments = segments
+
+        xs = segments[:, [0, 2]]; ys = segments[:, [1, 3]]
+        xmin, xmax = xs.min(), xs.max()
+        ymin, ymax = ys.min(), ys.max()
+        if cell_size is None:
+            extent = max(xmax - xmin, ymax - ymin)
+            cell_size = extent / math.ceil(math.sqrt(len(segments)))
+        # 全部线段挤在一个点上时，格子尺寸随便取个正数即可
+        self.cell_size = cell_size if cell_size > 0 else 1.0
+        self.origin = (xmin, ymin)
+        self.nx = int((xmax - xmin) // self.cell_size) + 1
+        self.ny = int((ymax - ymin) // self.cell_size) + 1
+
+        # 展开成按格子排好序的(格子, 线段)对，即为CSR
+        seg_of, cell_of = self._crossed_cells(segments)
+        self.cell_items = seg_of
+        counts = np.bincount(cell_of, minlength=self.nx * self.ny)
+        self.cell_ptr = np.concatenate([[0], np.cumsum(counts)])
+        self.empty_rings = chessboard_distance(counts.reshape(self.ny, self.nx) > 0).ravel()
+
+    ARRAY_FIELDS = ('segments', 'cell_ptr', 'cell_items', 'empty_rings')
+
+    def to_arrays(self) -> tuple[dict[str, np.ndarray], dict[str, Any]]:
+        '''拆成(大数组, 标量参数)两部分，便于放进共享内存'''
+        arrays = {name: getattr(self, name) for name in self.ARRAY_FIELDS}
+        params = {'origin': tuple(map(float, self.origin)), 'cell_size': float(self.cell_size),
+                  'nx': int(self.nx), 'ny': int(self.ny)}
+        return arrays, params
+
+    @classmethod
+    def from_arrays(cls, arrays: dict[str, np.ndarray], params: dict[str, Any]) -> 'SegmentGrid':
+        '''用to_arrays的结果直接还原索引，不重新建立'''
+        grid = cls.__new__(cls)
+        for name in cls.ARRAY_FIELDS: setattr(grid, name, arrays[name])
+        grid.origin = tuple(params['origin'])
+        grid.cell_size = params['cell_size']
+        grid.nx = params['nx']
+        grid.ny = params['ny']
+        return grid
+
+    def _crossed_cells(self, segments: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        每条线段穿过的格子，返回去重并按格子排好序的(线段编号, 格子编号)两个数组。
+        线段与竖、横网格线的交点把它切成若干小段，每一小段落在同一个格子里，
+        取各小段中点所在的格子，再加上两个端点所在的格子
+        '''
+        x1, y1, x2, y2 = segments.T
+        ix0 = self._cell_x(np.minimum(x1, x2)); ix1 = self._cell_x(np.maximum(x1, x2))
+        iy0 = self._cell_y(np.minimum(y1, y2)); iy1 = self._cell_y(np.maximum(y1, y2))
+        n_x = ix1 - ix0; n_y = iy1 - iy0
+        n_seg = len(segments)
+        seg_ids = np.arange(n_seg)
+
+        def crossings(n: np.ndarray, i0: np.ndarray, origin: float,
+                      a: np.ndarray, b: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+            # 第k条线段与它跨过的n[k]条网格线的交点参数t
+            seg = np.repeat(seg_ids, n)
+            j = np.arange(len(seg)) - np.repeat(np.cumsum(n) - n, n) + 1
+            line = origin + (i0[seg] + j) * self.cell_size
+            return seg, (line - a[seg]) / (b[seg] - a[seg])
+
+        sx, tx = crossings(n_x, ix0, self.origin[0], x1, x2)
+        sy, ty = crossings(n_y, iy0, self.origin[1], y1, y2)
+        seg = np.concatenate([seg_ids, seg_ids, sx, sy])
+        t = np.concatenate([np.zeros(n_seg), np.ones(n_seg), tx, ty])
+        order = np.lexsort((t, seg))
+        seg = seg[order]; t = t[order]
+        same = seg[1:] == seg[:-1]
+        t_mid = np.concatenate([(t[1:] + t[:-1])[same] / 2, [0.0] * n_seg, [1.0] * n_seg])
+        seg_mid = np.concatenate([seg[1:][same], seg_ids, seg_ids])
+
+        px = x1[seg_mid] + t_mid * (x2 - x1)[seg_mid]
+        py = y1[seg_mid] + t_mid * (y2 - y1)[seg_mid]
+        cell = self._cell_y(py) * self.nx + self._cell_x(px)
+        # 以格子为主序编码后排序去重，结果直接就是CSR的顺序
+        key = cell * n_seg + seg_mid
+        key.sort()
+        key = key[np.concatenate([[True], key[1:] != key[:-1]])]
+        return key % n_seg, key // n_seg
+
+    def _cell_x(self, x: np.ndarray) -> np.ndarray:
+        ix = ((x - self.origin[0]) // self.cell_size).astype(int)
+        return np.clip(ix, 0, self.nx - 1)
+
+    def _cell_y(self, y: np.ndarray) -> np.ndarray:
+        iy = ((y - self.origin[1]) // self.cell_size).astype(int)
+        return np.clip(iy, 0, self.ny - 1)
+
+    def _block_min(self, point: Point, cx: int, cy: int, k: int) -> float:
+        '''点到以(cx, cy)为中心、半宽为k的方块内所有线段的最短距离'''
+        x0, x1 = max(cx - k, 0), min(cx + k, self.nx - 1)
+        rows = np.arange(max(cy - k, 0), min(cy + k, self.ny - 1) + 1) * self.nx
+        starts = self.cell_ptr[rows + x0]
+        lengths = self.cell_ptr[rows + x1 + 1] - starts
+        total = int(lengths.sum())
+        if total == 0: return math.inf
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        candidates = self.cell_items[np.arange(total) + offsets]
+        return float(points_segments_distance(point, self.segments[candidates]).min())
+
+    def distance(self, point: Point) -> float:
+        '''求点到所有线段的最短距离'''
+        px, py = point
+        cx = int(clamp((px - self.origin[0]) // self.cell_size, 0, self.nx - 1))
+        cy = int(clamp((py - self.origin[1]) // self.cell_size, 0, self.ny - 1))
+
+        # 方块外的格子与中心格子至少隔着k格，点在网格外时也成立
+        k = max(int(self.empty_rings[cy * self.nx + cx]), 1)
+        best = self._block_min(point, cx, cy, k)
+        if best > k * self.cell_size:
+            # 比best更近的线段一定落在半宽为best/cell_size+1的方块里
+            best = self._block_min(point, cx, cy, int(best // self.cell_size) + 1)
+        return best
+
+    def _blocks_min(self, points: np.ndarray, cx: np.ndarray, cy: np.ndarray,
+                    k: np.ndarray) -> np.ndarray:
+        '''_block_min的批量版本，每个点各自扫描以(cx, cy)为中心、半宽为k的方块'''
+        n = len(points)
+        x0 = np.maximum(cx - k, 0); x1 = np.minimum(cx + k, self.nx - 1)
+        y0 = np.maximum(cy - k, 0); y1 = np.minimum(cy + k, self.ny - 1)
+        # 展开成(点, 方块中的一行)对，每行仍是cell_items中的一段连续切片
+        n_rows = y1 - y0 + 1
+        pt = np.repeat(np.arange(n), n_rows)
+        row = y0[pt] + np.arange(len(pt)) - np.repeat(np.cumsum(n_rows) - n_rows, n_rows)
+        starts = self.cell_ptr[row * self.nx + x0[pt]]
+        lengths = self.cell_ptr[row * self.nx + x1[pt] + 1] - starts
+        # 再展开成(点, 候选线段)对，一起算距离
+        total = int(lengths.sum())
+        pair_pt = np.repeat(pt, lengths)
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        candidates = self.cell_items[np.arange(total) + offsets]
+        dist = points_segments_distance((points[pair_pt, 0], points[pair_pt, 1]),
+                                        self.segments[candidates])
+        # 候选对按点排好了序，分段取最小值
+        per_point = np.bincount(pt, weights=lengths, minlength=n).astype(int)
+        best = np.full(n, math.inf)
+        has = per_point > 0
+        if total: best[has] = np.minimum.reduceat(dist, (np.cumsum(per_point) - per_point)[has])
+        return best
+
+    def distances(self, points: np.ndarray) -> np.ndarray:
+        '''distance的批量版本，结果与逐点调用完全相同'''
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        result = np.empty(len(points))
+        for lo in range(0, len(points), QUERY_BATCH):
+            chunk = points[lo:lo + QUERY_BATCH]
+            cx = self._cell_x(chunk[:, 0]); cy = self._cell_y(chunk[:, 1])
+            k = np.maximum(self.empty_rings[cy * self.nx + cx], 1)
+            best = self._blocks_min(chunk, cx, cy, k)
+            far = best > k * self.cell_size
+            if far.any():
+                k_far = (best[far] // self.cell_size).astype(int) + 1
+                best[far] = self._blocks_min(chunk[far], cx[far], cy[far], k_far)
+            result[lo:lo + QUERY_BATCH] = best
+        return result
+
+
+def chessboard_distance(occupied: np.ndarray) -> np.ndarray:
+    '''每个格子到最近的被占据格子的切比雪夫距离（以格为单位）'''
+    ny, nx = occupied.shape
+    unreached = np.iinfo(np.int64).max
+    dist = np.where(occupied, 0, unreached)
+    reached = occupied.copy()
+    k = 0
+    while not reached.all():
+        k += 1
+        # 已到达区域向外膨胀一圈
+        padded = np.pad(reached, 1)
+        grown = np.zeros_like(reached)
+        for dy in range(3):
+            for dx in range(3):
+                grown |= padded[dy:dy + ny, dx:dx + nx]
+        dist[grown & ~reached] = k
+        reached = grown
+    return dist
@@ -1,5 +1,5 @@
 import math
-from typing import cast
+from typing import Optional, cast
 
 import numpy as np
 import pandas as pd
@@ -93,3 +93,112 @@ def point_line_distance(p: Point, l: Line):
 
     return point_distance(p, min_point)
 
+
+def points_segments_distance(p: Point, segs: np.ndarray) -> np.ndarray:
+    '''
+    点到一组线段的距离，point_line_distance的向量化版本
+    segs的每一行为(x1, y1, x2, y2)；p的两个分量也可以是形如(n, 1)的数组，
+    此时结果为n个点分别到各线段的距离矩阵
+    '''
+    px, py = p
+    x1, y1, x2, y2 = segs[:, 0], segs[:, 1], segs[:, 2], segs[:, 3]
+    dx = x2 - x1; dy = y2 - y1
+    mag_square = dx * dx + dy * dy
+    degenerate = mag_square < 0.00000001 ** 2
+    # 退化线段取中点，与point_line_distance保持一致
+    lambda_ = ((px - x1) * dx + (py - y1) * dy) / np.where(degenerate, 1, mag_square)
+    lambda_ = np.where(degenerate, 0.5, np.clip(lambda_, 0, 1))
+    return np.hypot(px - (x1 + lambda_ * dx), py - (y1 + lambda_ * dy))
+
+
+class MomentSums:
+    '''
+    点集的充分统计量：点数n，以及Σx、Σy、Σx²、Σy²、Σxy。
+    x、y先减去一个固定的中心再累加，以减小方差计算中的相消误差。
+    有了它，移动若干个点之后的统计数字可以O(1)地算出来，不必重算整个数据集
+    '''
+
+    n: int
+    center: Point
+    sums: np.ndarray
+
+    def __init__(self, points: np.ndarray, center: Optional[Point] = None) -> None:
+        self.n = len(points)
+        if center is None: center = cast(Point, tuple(points.mean(axis=0)))
+        self.center = center
+        self.resync(points)
+
+    def contributions(self, points: np.ndarray) -> np.ndarray:
+        '''每个点对(Σx, Σy, Σx², Σy², Σxy)的贡献，形状为(len(points), 5)'''
+        u = points[:, 0] - self.center[0]
+        v = points[:, 1] - self.center[1]
+        return np.stack([u, v, u * u, v * v, u * v], axis=1)
+
+    def resync(self, points: np.ndarray) -> None:
+        '''从点集重新累加，消除增量更新积累的舍入误差'''
+        self.sums = self.contributions(points).sum(axis=0)
+
+    def stats(self, delta: Optional[np.ndarray] = None) -> DFStats:
+        '''由充分统计量算出与df_stats相同的五个统计数字，delta为假想的增量'''
+        su, sv, suu, svv, suv = self.sums if delta is None else self.sums + delta
+        n = self.n
+        var_x = (suu - su * su / n) / (n - 1)
+        var_y = (svv - sv * sv / n) / (n - 1)
+        cov = (suv - su * sv / n) / (n - 1)
+        xsd = math.sqrt(max(var_x, 0)); ysd = math.sqrt(max(var_y, 0))
+        pc = cov / (xsd * ysd) if xsd > 0 and ysd > 0 else math.nan
+        return (self.center[0] + su / n, self.center[1] + sv / n, xsd, ysd, pc)
+
+    def move_delta(self, old: Point, new: Point) -> np.ndarray:
+        '''把一个点从old移到new时充分统计量的增量'''
+        u0 = old[0] - self.center[0]; v0 = old[1] - self.center[1]
+        u1 = new[0] - self.center[0]; v1 = new[1] - self.center[1]
+        return np.array([u1 - u0, v1 - v0, u1 * u1 - u0 * u0,
+                         v1 * v1 - v0 * v0, u1 * v1 - u0 * v0])
+
+
+# 预判统计数字时留出的安全边距，以舍入步长为单位，分为绝对和相对两部分，
+# 用来吸收充分统计量与pandas两种算法之间的舍入误差
+SLACK_MARGIN: float = 1e-6
+SLACK_RTOL: float = 1e-9
+
+class StatSlack:
+    '''
+    锁定的统计数字在n_trunc位小数下的取整区间。
+    第i个统计数字乘以10**n_trunc后取整为k，要保持取整结果不变，它只能在
+    (k-0.5, k+0.5)内活动，当前值到区间两端的距离就是它的余量。
+    离区间边界超过安全边距的新值可以直接判定，落在边距内的才交给精确检查
+    '''
+
+    scale: int
+    inner: list[Bound]
+    outer: list[Bound]
+
+    def __init__(self, stats: DFStats, n_trunc: int) -> None:
+        self.scale = 10 ** n_trunc
+        self.inner = []
+        self.outer = []
+        for s in stats:
+            k = round(s * self.scale)
+            margin = SLACK_MARGIN + SLACK_RTOL * abs(k)
+            self.inner.append((k - 0.5 + margin, k + 0.5 - margin))
+            self.outer.append((k - 0.5 - margin, k + 0.5 + margin))
+
+    def shift_bounds(self, n: int, mean: Point) -> tuple[Bound, Bound]:
+        '''
+        把均值的余量换算成单个点的位移范围：一个点位移d，均值就变化d/n，
+        位移超出这个范围时均值的取整结果必然改变，不必再算其他统计数字
+        '''
+        return cast(tuple[Bound, Bound], tuple(
+            ((lo / self.scale - m) * n, (hi / self.scale - m) * n)
+            for (lo, hi), m in zip(self.outer[:2], mean)))
+
+    def classify(self, stats: DFStats) -> Optional[bool]:
+        '''真：取整结果确定不变；假：确定改变；None：离边界太近，需要精确检查'''
+        decided = True
+        for s, (in_lo, in_hi), (out_lo, out_hi) in zip(stats, self.inner, self.outer):
+            scaled = s * self.scale
+            # nan的比较全为假，会落到需要精确检查的分支
+            if scaled < out_lo or scaled > out_hi: return False
+            if not in_lo < scaled < in_hi: decided = False
+        return True if decided else None
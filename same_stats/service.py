@@ -0,0 +1,563 @@
+'''
+本地作业服务。
+常驻后台，接收与do_single_run参数一致的运行规格，排队分派给预热好的
+工作进程池，并把进度和分阶段耗时推送给订阅者。
+源数据集和目标图形在服务进程里读入并放进共享内存，每份只读一次，
+工作进程凭句柄直接映射，不再各自读csv、建索引。
+
+协议：本机TCP连接上逐行收发JSON。请求形如
+    {"op": "submit", "spec": {"source_path_str": "datasaurus", "target_path_str": "x"}}
+    {"op": "watch", "job_id": 1}
+    {"op": "cancel", "job_id": 1}
+    {"op": "status"}
+每个请求对应一行回复；watch会持续推送事件直到作业结束。
+
+用法：
+    python -m same_stats.service serve --workers 4
+    python -m same_stats.service submit datasaurus x --n-iter 20000 --watch
+'''
+
+import asyncio
+import inspect
+import itertools
+import json
+import multiprocessing as mp
+import time
+import traceback
+from datetime import datetime
+from multiprocessing.connection import Connection
+from multiprocessing.synchronize import Event
+from pathlib import Path
+from typing import Any, AsyncIterator, Optional
+
+import click
+
+from . import algo
+from .shm import (SharedArrayHandle, SharedArrayRegistry, SharedDestinationHandle,
+                  attach_destination, attach_points)
+from .utils import (ILoopIndicator, read_point_csv, resolve_source_path, resolve_target,
+                    target_display_name)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# 进度汇报与取消检查的最小间隔（秒）
+REPORT_INTERVAL: float = 0.2
+# 服务端轮询工作进程管道的间隔（秒）
+POLL_INTERVAL: float = 0.05
+
+FINAL_STATES = ('done', 'failed', 'cancelled')
+
+
+class JobCancelled(Exception):
+    '''作业被取消，由进度指示器在工作进程中抛出以打断循环'''
+
+
+class PipeLoopIndicator(ILoopIndicator):
+    '''通过管道向服务进程汇报进度与分阶段耗时，顺便检查取消标志'''
+
+    conn: Connection
+    job_id: int
+    cancel_event: Event
+    n_total: int
+    n_done: int
+    phase_times: dict[str, float]
+
+    def __init__(self, conn: Connection, job_id: int, cancel_event: Event) -> None:
+        self.conn = conn
+        self.job_id = job_id
+        self.cancel_event = cancel_event
+        self.n_total = 0
+        self.n_done = 0
+        self.phase_times = {}
+        self._phase: Optional[str] = None
+        self._phase_start = self._last_report = self._iter_start = time.perf_counter()
+
+    def send(self, event: str, **payload: Any) -> None:
+        self.conn.send({'event': event, 'job_id': self.job_id, **payload})
+
+    def progress_payload(self) -> dict[str, Any]:
+        now = time.perf_counter()
+        phase_times = dict(self.phase_times)
+        if self._phase is not None:
+            phase_times[self._phase] = phase_times.get(self._phase, 0) + now - self._phase_start
+        iter_time = now - self._iter_start
+        return {
+            'n_done': self.n_done,
+            'n_total': self.n_total,
+            'iters_per_sec': self.n_done / iter_time if iter_time > 0 else 0.0,
+            'phases': phase_times,
+        }
+
+    def init(self, n_total: int) -> None:
+        self.n_total = n_total
+        self.n_done = 0
+        self._iter_start = time.perf_counter()
+        self.send('progress', **self.progress_payload())
+
+    def increment(self) -> None:
+        self.n_done += 1
+        now = time.perf_counter()
+        if now - self._last_report < REPORT_INTERVAL: return
+        self._last_report = now
+        if self.cancel_event.is_set() or not _parent_alive(): raise JobCancelled
+        self.send('progress', **self.progress_payload())
+
+    def enter_phase(self, name: str) -> None:
+        # 渲染、出视频这些阶段里没有迭代，取消请求在阶段切换时检查
+        if self.cancel_event.is_set() or not _parent_alive(): raise JobCancelled
+        now = time.perf_counter()
+        if self._phase is not None:
+            self.phase_times[self._phase] = \
+                self.phase_times.get(self._phase, 0) + now - self._phase_start
+        self._phase = name
+        self._phase_start = now
+        self.send('phase', phase=name)
+
+
+def _warm_up() -> None:
+    '''工作进程启动时预先导入重量级依赖，之后每个作业都不用再付这份钱'''
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot
+    import seaborn
+    from . import __main__
+
+def _parent_alive() -> bool:
+    # fork出来的兄弟进程也持有管道的另一端，父进程死了管道未必断开，得主动检查
+    parent = mp.parent_process()
+    return parent is None or parent.is_alive()
+
+def _worker_main(conn: Connection, cancel_event: Event) -> None:
+    '''工作进程主循环：收一个作业，跑一个作业，收到None或服务进程退出就退出'''
+    _warm_up()
+    from .__main__ import do_prepared_run
+
+    while True:
+        if not conn.poll(REPORT_INTERVAL):
+            if _parent_alive(): continue
+            break
+        try: msg = conn.recv()
+        except EOFError: break
+        if msg is None: break
+        job_id, spec, (source_name, source_handle, target_name, target_handle) = msg
+        indicator = PipeLoopIndicator(conn, job_id, cancel_event)
+        # 源数据集和目标图形已由服务进程读好，按路径找文件的参数用不上了
+        kwargs = {key: value for key, value in spec.items()
+                  if key not in ('source_path_str', 'target_path_str', 'source_home_path')}
+        kwargs['output_home_path'] = Path(kwargs['output_home_path'])
+        try:
+            do_prepared_run(attach_points(source_handle), source_name,
+                            attach_destination(target_handle), target_name,
+                            **kwargs, loop_indicator=indicator)
+        except JobCancelled:
+            indicator.send('cancelled', **indicator.progress_payload())
+        except Exception as e:
+            indicator.send('failed', error=repr(e),
+                           traceback=traceback.format_exc(),
+                           **indicator.progress_payload())
+        else:
+            indicator.send('done', **indicator.progress_payload())
+
+
+# 派给工作进程的输入：(源数据集名, 源点集句柄, 目标图形名, 目标图形句柄)
+JobInputs = tuple[str, SharedArrayHandle, str, SharedDestinationHandle]
+
+
+class Job:
+    '''服务端记录的一个作业'''
+
+    job_id: int
+    spec: dict[str, Any]
+    inputs: JobInputs
+    state: str
+    attempts: int
+    cancel_requested: bool
+    last_progress: Optional[dict[str, Any]]
+    history: list[dict[str, Any]]
+    watchers: set[asyncio.Queue]
+
+    def __init__(self, job_id: int, spec: dict[str, Any], inputs: JobInputs) -> None:
+        self.job_id = job_id
+        self.spec = spec
+        self.inputs = inputs
+        self.state = 'queued'
+        self.attempts = 0
+        self.cancel_requested = False
+        self.last_progress = None
+        self.history = []
+        self.watchers = set()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINAL_STATES
+
+    def publish(self, event: dict[str, Any]) -> None:
+        # 进度事件只保留最新一条，免得历史记录无限增长
+        if event['event'] == 'progress': self.last_progress = event
+        else: self.history.append(event)
+        if event['event'] in FINAL_STATES: self.state = event['event']
+        for q in self.watchers: q.put_nowait(event)
+
+    def replay(self) -> list[dict[str, Any]]:
+        '''新订阅者需要补发的事件'''
+        events = list(self.history)
+        if self.last_progress is not None and not self.finished:
+            events.append(self.last_progress)
+        return events
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            'job_id': self.job_id,
+            'state': self.state,
+            'attempts': self.attempts,
+            'spec': self.spec,
+            'progress': self.last_progress,
+        }
+
+
+def _file_key(kind: str, path: Path) -> str:
+    '''共享内存注册表中文件数据的键，文件改动后键随之改变'''
+    stat = path.stat()
+    return f'{kind}:{path.resolve()}:{stat.st_mtime_ns}'
+
+
+class _Worker:
+    '''一个常驻工作进程及其通信管道'''
+
+    process: mp.process.BaseProcess
+    conn: Connection
+    cancel_event: Event
+
+    def __init__(self, ctx: mp.context.BaseContext) -> None:
+        self.conn, child_conn = ctx.Pipe()
+        self.cancel_event = ctx.Event()
+        self.process = ctx.Process(target=_worker_main,
+                                   args=(child_conn, self.cancel_event),
+                                   daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def stop(self) -> None:
+        try: self.conn.send(None)
+        except (BrokenPipeError, OSError): pass
+        self.process.join(1)
+        if self.process.is_alive(): self.process.kill()
+        self.conn.close()
+
+
+class JobService:
+    '''作业调度器：作业队列 + 固定数量的常驻工作进程'''
+
+    n_workers: int
+    max_attempts: int
+    source_home: Path
+    output_home: Path
+    session_home: Path
+    jobs: dict[int, Job]
+    registry: SharedArrayRegistry
+
+    def __init__(self,
+        n_workers: int = 2,
+        source_home: Path = Path('seed_datasets'),
+        output_home: Path = Path('results'),
+        max_attempts: int = 2,
+        mp_context: Optional[mp.context.BaseContext] = None,
+    ) -> None:
+        '''max_attempts：工作进程崩溃时一个作业最多被尝试几次'''
+        self.n_workers = n_workers
+        self.max_attempts = max_attempts
+        self.source_home = source_home
+        self.output_home = output_home
+        # 作业编号每次启动都从1开始，按启动时间分开存放，免得覆盖上一次的结果
+        self.session_home = output_home / \
+            f"service-{datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}"
+        self.jobs = {}
+        self.registry = SharedArrayRegistry()
+        self._ctx = mp.get_context() if mp_context is None else mp_context
+        self._ids = itertools.count(1)
+        self._queue: asyncio.Queue[Job] = asyncio.Queue()
+        self._running: dict[int, _Worker] = {}
+        self._supervisors: list[asyncio.Task] = []
+
+    async def start(self) -> None:
+        self._supervisors = [asyncio.create_task(self._supervise())
+                             for _ in range(self.n_workers)]
+
+    async def stop(self) -> None:
+        for task in self._supervisors: task.cancel()
+        await asyncio.gather(*self._supervisors, return_exceptions=True)
+        self._supervisors = []
+        # 工作进程都已退出，可以释放共享内存了
+        self.registry.close()
+
+    def normalize_spec(self, spec: dict[str, Any]) -> dict[str, Any]:
+        '''按do_single_run的签名补全默认值，拒绝未知参数'''
+        from .__main__ import do_single_run
+        params = inspect.signature(do_single_run).parameters
+        allowed = set(params) - {'loop_indicator'}
+        unknown = set(spec) - allowed
+        if unknown: raise ValueError(f'未知参数：{sorted(unknown)}')
+
+        defaults = {'n_iter': 100000, 'n_frames': 100, 'error_precision': 2,
+                    'block_size': 1, 'row_selection': 'uniform',
+                    'source_home_path': str(self.source_home)}
+        full = {**defaults, **spec}
+        missing = allowed - set(full) - {'output_home_path'}
+        if missing: raise ValueError(f'缺少参数：{sorted(missing)}')
+        for key in ('n_iter', 'n_frames', 'error_precision', 'block_size'):
+            full[key] = int(full[key])
+        return full
+
+    def share_inputs(self, spec: dict[str, Any]) -> JobInputs:
+        '''
+        读入作业的源数据集和目标图形并放进共享内存，同一份数据只读入一次。
+        文件按路径和修改时间区分，改过的文件会重新读入
+        '''
+        source_path = resolve_source_path(spec['source_path_str'],
+                                          Path(spec['source_home_path']))
+        source_key = _file_key('source', source_path)
+        if source_key not in self.registry:
+            self.registry.publish_points(source_key, read_point_csv(source_path))
+
+        target_str = spec['target_path_str']
+        target_key = f'target:{target_str}' if target_str in algo.DEFAULT_DESTS \
+            else _file_key('target', Path(target_str))
+        if target_key not in self.registry:
+            self.registry.publish_destination(target_key, resolve_target(target_str))
+
+        return (source_path.stem, self.registry[source_key],
+                target_display_name(target_str), self.registry[target_key])
+
+    def submit(self, spec: dict[str, Any]) -> Job:
+        spec = self.normalize_spec(spec)
+        # 找不到文件之类的错误在提交时就报给客户端
+        inputs = self.share_inputs(spec)
+        job = Job(next(self._ids), spec, inputs)
+        spec.setdefault('output_home_path',
+                        str(self.session_home / f'job-{format(job.job_id, "05")}'))
+        self.jobs[job.job_id] = job
+        self._queue.put_nowait(job)
+        return job
+
+    def cancel(self, job_id: int) -> Job:
+        job = self.jobs[job_id]
+        if job.finished: return job
+        job.cancel_requested = True
+        worker = self._running.get(job_id)
+        if worker is not None:
+            # 运行中的作业由进度指示器在工作进程里自行中止
+            worker.cancel_event.set()
+        else:
+            job.publish({'event': 'cancelled', 'job_id': job_id})
+        return job
+
+    async def _supervise(self) -> None:
+        '''每个工作进程配一个监工协程，负责派活、转发事件和收尸'''
+        worker = _Worker(self._ctx)
+        try:
+            while True:
+                job = await self._queue.get()
+                if job.finished: continue
+                # 工作进程可能在空闲时死掉，派活前先检查
+                if not worker.process.is_alive():
+                    worker.stop()
+                    worker = _Worker(self._ctx)
+                worker.cancel_event.clear()
+                try:
+                    worker.conn.send((job.job_id, job.spec, job.inputs))
+                except (BrokenPipeError, OSError):
+                    # 作业没送到工作进程手里，不算一次尝试，原样重排
+                    worker.stop()
+                    worker = _Worker(self._ctx)
+                    self._queue.put_nowait(job)
+                    continue
+                job.state = 'running'
+                job.attempts += 1
+                job.publish({'event': 'started', 'job_id': job.job_id,
+                             'attempt': job.attempts, 'pid': worker.process.pid})
+                self._running[job.job_id] = worker
+                try:
+                    final = await self._pump(worker, job)
+                finally:
+                    del self._running[job.job_id]
+                if final is not None: continue
+
+                # 工作进程死了，换一个新的，作业视情况重排或判定失败
+                exitcode = worker.process.exitcode
+                worker.stop()
+                worker = _Worker(self._ctx)
+                if job.cancel_requested:
+                    job.publish({'event': 'cancelled', 'job_id': job.job_id})
+                elif job.attempts < self.max_attempts:
+                    job.state = 'queued'
+                    job.publish({'event': 'retry', 'job_id': job.job_id,
+                                 'exitcode': exitcode})
+                    self._queue.put_nowait(job)
+                else:
+                    job.publish({'event': 'failed', 'job_id': job.job_id,
+                                 'error': f'工作进程崩溃(exitcode={exitcode})'})
+        finally:
+            worker.stop()
+
+    async def _pump(self, worker: _Worker, job: Job) -> Optional[dict[str, Any]]:
+        '''转发工作进程的事件直到作业结束；工作进程崩溃时返回None'''
+        while True:
+            try:
+                while worker.conn.poll():
+                    event = worker.conn.recv()
+                    job.publish(event)
+                    if event['event'] in FINAL_STATES: return event
+            except (EOFError, OSError):
+                return None
+            if not worker.process.is_alive() and not worker.conn.poll():
+                return None
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def watch(self, job_id: int) -> AsyncIterator[dict[str, Any]]:
+        job = self.jobs[job_id]
+        q: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        for event in job.replay(): q.put_nowait(event)
+        job.watchers.add(q)
+        try:
+            while True:
+                if job.finished and q.empty(): return
+                event = await q.get()
+                yield event
+        finally:
+            job.watchers.discard(q)
+
+    async def handle_client(self,
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+    ) -> None:
+        async def reply(obj: dict[str, Any]) -> None:
+            writer.write(json.dumps(obj, ensure_ascii=False).encode() + b'\n')
+            await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                try:
+                    req = json.loads(line)
+                    if not isinstance(req, dict): raise ValueError(f'请求应为JSON对象({req!r})')
+                    op = req.get('op')
+                    if op == 'submit':
+                        await reply({'ok': True, 'job': self.submit(req['spec']).snapshot()})
+                    elif op == 'cancel':
+                        await reply({'ok': True, 'job': self.cancel(int(req['job_id'])).snapshot()})
+                    elif op == 'status':
+                        if 'job_id' in req:
+                            jobs = [self.jobs[int(req['job_id'])]]
+                        else:
+                            jobs = list(self.jobs.values())
+                        await reply({'ok': True, 'jobs': [j.snapshot() for j in jobs]})
+                    elif op == 'watch':
+                        async for event in self.watch(int(req['job_id'])):
+                            await reply({'ok': True, **event})
+                        await reply({'ok': True, 'event': 'end', 'job_id': req['job_id']})
+                    else:
+                        raise ValueError(f'未知操作({op})')
+                except (KeyError, ValueError, TypeError, OSError) as e:
+                    await reply({'ok': False, 'error': repr(e)})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> asyncio.Server:
+        await self.start()
+        return await asyncio.start_server(self.handle_client, host, port)
+
+
+async def request(
+    payload: dict[str, Any],
+    host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+) -> AsyncIterator[dict[str, Any]]:
+    '''客户端：发一个请求，逐条产出回复（watch之外都只有一条）'''
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(json.dumps(payload).encode() + b'\n')
+        await writer.drain()
+        while line := await reader.readline():
+            msg = json.loads(line)
+            yield msg
+            if payload.get('op') != 'watch' or msg.get('event') == 'end' or not msg['ok']:
+                break
+    finally:
+        writer.close()
+
+
+if __name__ == '__main__':
+    def print_replies(payload: dict[str, Any], host: str, port: int) -> list[dict[str, Any]]:
+        async def run():
+            replies = []
+            async for msg in request(payload, host, port):
+                print(json.dumps(msg, ensure_ascii=False))
+                replies.append(msg)
+            return replies
+        return asyncio.run(run())
+
+    @click.group()
+    @click.option('--host', type=str, default=DEFAULT_HOST)
+    @click.option('--port', type=int, default=DEFAULT_PORT)
+    @click.pass_context
+    def main(ctx: click.Context, host: str, port: int):
+        ctx.obj = (host, port)
+
+    @main.command()
+    @click.option('--workers', type=int, default=2)
+    @click.option('--source-home', 'source_home_str', type=str, default='seed_datasets')
+    @click.option('--output-home', 'output_home_str', type=str, default='results')
+    @click.pass_obj
+    def serve(addr: tuple[str, int], workers: int, source_home_str: str, output_home_str: str):
+        async def run():
+            service = JobService(workers, Path(source_home_str), Path(output_home_str))
+            server = await service.serve(*addr)
+            print(f'服务已启动：{addr[0]}:{addr[1]}')
+            try:
+                async with server: await server.serve_forever()
+            finally:
+                await service.stop()
+        try: asyncio.run(run())
+        except KeyboardInterrupt: pass
+
+    @main.command()
+    @click.argument('source', type=str)
+    @click.argument('target', type=str)
+    @click.option('--n-iter', type=int, default=100000)
+    @click.option('--n-frames', type=int, default=100)
+    @click.option('--error-precision', type=int, default=2)
+    @click.option('--block-size', type=int, default=1)
+    @click.option('--row-selection', type=click.Choice(['uniform', 'distance']),
+                  default='uniform')
+    @click.option('--watch', 'do_watch', is_flag=True)
+    @click.pass_obj
+    def submit(addr: tuple[str, int], source: str, target: str,
+               n_iter: int, n_frames: int, error_precision: int,
+               block_size: int, row_selection: str, do_watch: bool):
+        spec = {'source_path_str': source, 'target_path_str': target,
+                'n_iter': n_iter, 'n_frames': n_frames, 'error_precision': error_precision,
+                'block_size': block_size, 'row_selection': row_selection}
+        replies = print_replies({'op': 'submit', 'spec': spec}, *addr)
+        if do_watch and replies[0]['ok']:
+            print_replies({'op': 'watch', 'job_id': replies[0]['job']['job_id']}, *addr)
+
+    @main.command()
+    @click.argument('job_id', type=int)
+    @click.pass_obj
+    def watch(addr: tuple[str, int], job_id: int):
+        print_replies({'op': 'watch', 'job_id': job_id}, *addr)
+
+    @main.command()
+    @click.argument('job_id', type=int)
+    @click.pass_obj
+    def cancel(addr: tuple[str, int], job_id: int):
+        print_replies({'op': 'cancel', 'job_id': job_id}, *addr)
+
+    @main.command()
+    @click.argument('job_id', type=int, required=False)
+    @click.pass_obj
+    def status(addr: tuple[str, int], job_id: Optional[int]):
+        payload: dict[str, Any] = {'op': 'status'}
+        if job_id is not None: payload['job_id'] = job_id
+        print_replies(payload, *addr)
+
+    main()
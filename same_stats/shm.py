@@ -0,0 +1,162 @@
+'''
+共享内存注册表。
+多进程的超参数扫描和作业服务中，父进程把源点集和目标图形的预计算
+数据（线段数组、网格索引）放进共享内存一次，子进程凭一个很小的句柄直接
+映射成只读的numpy数组，不再各自读csv、重建索引，也不必随每个任务pickle
+整份数据。
+
+父进程退出时注册表会清理全部共享内存段；父进程崩溃时，POSIX下由
+multiprocessing的resource_tracker负责回收，Windows下最后一个句柄关闭时
+系统自动回收。
+'''
+
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from .algo.dest_types import IDestination, LineShapeDestination
+from .algo.spatial import SegmentGrid
+
+
+class SharedArrayHandle:
+    '''共享内存中一个数组的句柄，可以廉价地pickle给子进程'''
+
+    shm_name: str
+    shape: tuple[int, ...]
+    dtype: str
+
+    def __init__(self, shm_name: str, shape: tuple[int, ...], dtype: str) -> None:
+        self.shm_name = shm_name
+        self.shape = shape
+        self.dtype = dtype
+
+
+class SharedDestinationHandle:
+    '''
+    目标图形的句柄
+    带网格索引的线段图形存的是索引数组的句柄，其他（都很小）直接带着对象本身
+    '''
+
+    grid_arrays: Optional[dict[str, SharedArrayHandle]]
+    grid_params: Optional[dict[str, Any]]
+    dest: Optional[IDestination]
+
+    def __init__(self,
+        grid_arrays: Optional[dict[str, SharedArrayHandle]] = None,
+        grid_params: Optional[dict[str, Any]] = None,
+        dest: Optional[IDestination] = None,
+    ) -> None:
+        self.grid_arrays = grid_arrays
+        self.grid_params = grid_params
+        self.dest = dest
+
+
+def _unlink_all(segments: list[shared_memory.SharedMemory]) -> None:
+    for shm in segments:
+        try:
+            shm.close()
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+    segments.clear()
+
+
+class SharedArrayRegistry:
+    '''
+    父进程持有的共享内存注册表。可以作为上下文管理器使用；
+    忘了关的话，对象被回收或解释器退出时也会清理
+    '''
+
+    handles: dict[str, Any]
+
+    def __init__(self) -> None:
+        # 先把resource_tracker启动起来，之后fork的子进程都沿用它；否则子进程映射时
+        # 会各自启动一个，子进程被杀掉时那个tracker会把仍在使用的共享内存段删掉
+        resource_tracker.ensure_running()
+        self.handles = {}
+        self._segments: list[shared_memory.SharedMemory] = []
+        self._finalizer = weakref.finalize(self, _unlink_all, self._segments)
+
+    def __enter__(self) -> 'SharedArrayRegistry':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def __getitem__(self, key: str) -> Any:
+        return self.handles[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.handles
+
+    def close(self) -> None:
+        '''释放全部共享内存段，之后已发出的句柄失效'''
+        self._finalizer()
+        self.handles.clear()
+
+    def share_array(self, array: np.ndarray) -> SharedArrayHandle:
+        '''把数组复制进一段新的共享内存'''
+        array = np.ascontiguousarray(array)
+        # 空数组也得申请至少1字节
+        shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self._segments.append(shm)
+        np.ndarray(array.shape, array.dtype, buffer=shm.buf)[...] = array
+        return SharedArrayHandle(shm.name, array.shape, array.dtype.str)
+
+    def publish(self, key: str, array: np.ndarray) -> SharedArrayHandle:
+        if key in self.handles: raise KeyError(f'重复的键({key})')
+        handle = self.handles[key] = self.share_array(array)
+        return handle
+
+    def publish_points(self, key: str, df: pd.DataFrame) -> SharedArrayHandle:
+        '''发布源点集，子进程用attach_points取回DataFrame'''
+        return self.publish(key, df.loc[:, ['x', 'y']].to_numpy(dtype=float))
+
+    def publish_destination(self, key: str, dest: IDestination) -> SharedDestinationHandle:
+        '''发布目标图形；带网格索引的线段图形会连索引一起放进共享内存'''
+        if key in self.handles: raise KeyError(f'重复的键({key})')
+        if isinstance(dest, LineShapeDestination) and dest.index is not None:
+            arrays, params = dest.index.to_arrays()
+            handle = SharedDestinationHandle(
+                {name: self.share_array(arr) for name, arr in arrays.items()}, params)
+        else:
+            handle = SharedDestinationHandle(dest=dest)
+        self.handles[key] = handle
+        return handle
+
+
+# 子进程中已映射的共享内存段和还原出的目标图形，按共享内存段的名字缓存，
+# 同一份数据在一个进程里只映射、还原一次
+_attached: dict[str, shared_memory.SharedMemory] = {}
+_destinations: dict[str, IDestination] = {}
+
+def attach(handle: SharedArrayHandle) -> np.ndarray:
+    '''在当前进程中映射共享数组，返回零拷贝的只读视图'''
+    shm = _attached.get(handle.shm_name)
+    if shm is None:
+        shm = _attached[handle.shm_name] = shared_memory.SharedMemory(handle.shm_name)
+    view = np.ndarray(handle.shape, np.dtype(handle.dtype), buffer=shm.buf)
+    view.flags.writeable = False
+    return view
+
+def attach_points(handle: SharedArrayHandle) -> pd.DataFrame:
+    '''
+    取回源点集。SameStatsTransformation会自己复制一份来修改，
+    所以这里给出的DataFrame直接架在只读视图上
+    '''
+    return pd.DataFrame(attach(handle), columns=['x', 'y'], copy=False)
+
+def attach_destination(handle: SharedDestinationHandle) -> IDestination:
+    '''取回目标图形，带索引的线段图形不重新建立索引'''
+    if handle.dest is not None: return handle.dest
+    assert handle.grid_arrays is not None and handle.grid_params is not None
+    key = handle.grid_arrays['segments'].shm_name
+    dest = _destinations.get(key)
+    if dest is None:
+        arrays = {name: attach(h) for name, h in handle.grid_arrays.items()}
+        grid = SegmentGrid.from_arrays(arrays, handle.grid_params)
+        dest = _destinations[key] = LineShapeDestination.from_index(grid)
+    return dest
@@ -0,0 +1,253 @@
+'''
+超参数扫描。
+在若干源数据集和目标图形上并行跑短程转换，记录吞吐量、接受率和最终拟合
+程度，并给出“拟合质量-耗时”的帕累托前沿，用数据来挑默认参数。
+
+参数空间可以是网格，也可以是随机搜索：
+    python -m same_stats.sweep -s datasaurus -t x -t circle \\
+        --grid shake=0.05,0.1,0.2 --grid allowed_dist=1,2
+    python -m same_stats.sweep -s datasaurus -t x \\
+        --random shake=0.02:0.3 --random temp_max=0.1:0.6 --n-samples 20
+'''
+
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+import click
+import numpy as np
+import pandas as pd
+
+from . import algo
+from .shm import (SharedArrayHandle, SharedArrayRegistry, SharedDestinationHandle,
+                  attach_destination, attach_points)
+from .utils import read_point_csv, resolve_source_path, resolve_target
+
+# 可扫描的参数及其默认值，与SameStatsTransformation的默认值保持一致
+SWEEP_DEFAULTS: dict[str, float] = {
+    'shake': 0.1,
+    'allowed_dist': 2,
+    'temp_min': 0.0,
+    'temp_max': 0.4,
+    'n_error_trunc': 2,
+    'block_size': 1,
+}
+INT_PARAMS = {'n_error_trunc', 'block_size'}
+# 整数参数的下限，取整之后低于它的值SameStatsTransformation不接受
+INT_MINIMUMS: dict[str, int] = {'n_error_trunc': 0, 'block_size': 1}
+# 这两列越小越好，帕累托前沿在它们上面求
+PARETO_COLUMNS = ('mean_distance', 'wall_time')
+
+
+def _check_minimum(name: str, value: float) -> None:
+    minimum = INT_MINIMUMS.get(name)
+    if minimum is not None and round(value) < minimum:
+        raise ValueError(f'{name}取整后不能小于{minimum}({value})')
+
+def parse_grid_spec(spec: str) -> tuple[str, list[float]]:
+    '''解析形如shake=0.05,0.1,0.2的网格参数'''
+    name, _, values = spec.partition('=')
+    if name not in SWEEP_DEFAULTS or not values:
+        raise ValueError(f'无法解析网格参数({spec})')
+    parsed = [float(v) for v in values.split(',')]
+    for v in parsed: _check_minimum(name, v)
+    return name, parsed
+
+def parse_random_spec(spec: str) -> tuple[str, tuple[float, float]]:
+    '''解析形如shake=0.02:0.3的随机搜索区间'''
+    name, _, values = spec.partition('=')
+    lo, sep, hi = values.partition(':')
+    if name not in SWEEP_DEFAULTS or not sep:
+        raise ValueError(f'无法解析随机搜索参数({spec})')
+    bounds = float(lo), float(hi)
+    if bounds[0] > bounds[1]: raise ValueError(f'区间下限大于上限({spec})')
+    # 区间内任何值取整后都要合法，所以下限本身不能低于整数下限
+    if name in INT_MINIMUMS and bounds[0] < INT_MINIMUMS[name]:
+        raise ValueError(f'{name}的区间下限不能小于{INT_MINIMUMS[name]}({spec})')
+    return name, bounds
+
+def _complete(params: dict[str, float]) -> dict[str, float]:
+    full = {**SWEEP_DEFAULTS, **params}
+    for name in INT_PARAMS: full[name] = int(round(full[name]))
+    return full
+
+def grid_configs(grid: dict[str, list[float]]) -> Iterator[dict[str, float]]:
+    '''网格上的全部参数组合'''
+    names = list(grid)
+    for values in itertools.product(*(grid[n] for n in names)):
+        yield _complete(dict(zip(names, values)))
+
+def random_configs(
+    ranges: dict[str, tuple[float, float]], n_samples: int, seed: Optional[int] = None,
+) -> Iterator[dict[str, float]]:
+    '''在各区间内均匀采样n_samples组参数'''
+    rng = np.random.default_rng(seed)
+    for _ in range(n_samples):
+        yield _complete({n: rng.uniform(lo, hi) for n, (lo, hi) in ranges.items()})
+
+
+def run_config_shared(
+    source_name: str, source_handle: SharedArrayHandle,
+    target_name: str, target_handle: SharedDestinationHandle,
+    params: dict[str, float], n_iter: int, seed: int,
+) -> dict[str, Any]:
+    '''
+    跑一次不出图的短程转换，返回指标。在工作进程中执行，
+    源数据和目标图形从父进程发布的共享内存中取
+    '''
+    return _run_transform(source_name, attach_points(source_handle),
+                          target_name, attach_destination(target_handle), params, n_iter, seed)
+
+def _run_transform(
+    source_name: str, source: pd.DataFrame,
+    target_name: str, target: algo.dest_types.IDestination,
+    params: dict[str, float], n_iter: int, seed: int,
+) -> dict[str, Any]:
+    np.random.seed(seed)
+    transformer = algo.SameStatsTransformation(
+        source, target, n_iter,
+        temperature_range=(params['temp_min'], params['temp_max']),
+        n_error_trunc=int(params['n_error_trunc']),
+        perturb_params={'shake': params['shake'],
+                        'allowed_dist': params['allowed_dist']},
+        block_size=int(params['block_size']),
+    )
+    initial_distance = algo.mean_distance(transformer.cur_state, target)
+
+    t_start = time.perf_counter()
+    while not transformer.iterate(): pass
+    wall_time = time.perf_counter() - t_start
+
+    return {
+        'source': source_name,
+        'target': target_name,
+        'seed': seed,
+        **params,
+        **transformer.metrics.as_dict(),
+        'wall_time': wall_time,
+        'initial_distance': initial_distance,
+        'mean_distance': algo.mean_distance(transformer.cur_state, target),
+    }
+
+
+def pareto_front(df: pd.DataFrame, columns: tuple[str, ...] = PARETO_COLUMNS) -> pd.Series:
+    '''标记帕累托最优的行：不存在另一行在所有列上都不差且至少一列更好'''
+    values = df.loc[:, list(columns)].to_numpy(dtype=float)
+    # dominated[i, j]为真表示第j行支配第i行
+    no_worse = (values[None, :, :] <= values[:, None, :]).all(axis=2)
+    better = (values[None, :, :] < values[:, None, :]).any(axis=2)
+    dominated = (no_worse & better).any(axis=1)
+    return pd.Series(~dominated, index=df.index)
+
+def summarize(runs: pd.DataFrame) -> pd.DataFrame:
+    '''按参数组合汇总各源数据集/目标图形/随机种子上的结果，并标出帕累托前沿'''
+    param_cols = list(SWEEP_DEFAULTS)
+    # 失败的运行只留在runs.tsv里，不参与汇总
+    if 'error' in runs: runs = runs[runs['error'].isna()]
+    summary = runs.groupby(param_cols, as_index=False).agg(
+        n_runs=('mean_distance', 'size'),
+        mean_distance=('mean_distance', 'mean'),
+        wall_time=('wall_time', 'mean'),
+        iters_per_sec=('iters_per_sec', 'mean'),
+        point_moves_per_sec=('point_moves_per_sec', 'mean'),
+        acceptance_rate=('acceptance_rate', 'mean'),
+        proposals_per_iter=('proposals_per_iter', 'mean'),
+    )
+    summary['pareto'] = pareto_front(summary)
+    return summary.sort_values(['pareto', 'mean_distance'], ascending=[False, True],
+                               ignore_index=True)
+
+
+def run_sweep(
+    sources: list[Path], targets: dict[str, algo.dest_types.IDestination],
+    configs: list[dict[str, float]], n_iter: int,
+    n_repeats: int = 1, n_workers: Optional[int] = None, base_seed: int = 0,
+) -> pd.DataFrame:
+    '''
+    并行跑完所有(参数组合, 源, 目标, 重复)，返回逐次运行的结果表
+    targets为目标图形名到已经建好的目标图形的映射。
+    源数据和目标图形（含线段索引）只在父进程中读入、建立一次，发布到共享内存，
+    每个任务只携带几个句柄。
+    失败的运行记为只有参数和error列的一行，不影响其他运行
+    '''
+    with SharedArrayRegistry() as registry:
+        for source in sources:
+            registry.publish_points(f'source:{source}', read_point_csv(source))
+        for target, dest in targets.items():
+            registry.publish_destination(f'target:{target}', dest)
+        jobs = [
+            (source.stem, registry[f'source:{source}'], target, registry[f'target:{target}'],
+             params, n_iter, base_seed + i_repeat)
+            for params in configs
+            for source in sources
+            for target in targets
+            for i_repeat in range(n_repeats)
+        ]
+        with ProcessPoolExecutor(n_workers) as pool:
+            futures = [pool.submit(run_config_shared, *job) for job in jobs]
+            rows = []
+            for job, future in zip(jobs, futures):
+                try:
+                    rows.append(future.result())
+                except Exception as e:
+                    source_name, _, target, _, params, _, seed = job
+                    rows.append({'source': source_name, 'target': target, 'seed': seed,
+                                 **params, 'error': repr(e)})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    @click.command()
+    @click.option('-s', '--source', 'source_strs', type=str, multiple=True, required=True)
+    @click.option('-t', '--target', 'targets', type=str, multiple=True, required=True)
+    @click.option('--grid', 'grid_specs', type=str, multiple=True,
+                  help='网格参数，如shake=0.05,0.1,0.2')
+    @click.option('--random', 'random_specs', type=str, multiple=True,
+                  help='随机搜索区间，如shake=0.02:0.3')
+    @click.option('--n-samples', type=int, default=16)
+    @click.option('--n-iter', type=int, default=20000)
+    @click.option('--n-repeats', type=int, default=1)
+    @click.option('--workers', type=int, default=os.cpu_count())
+    @click.option('--seed', type=int, default=0)
+    @click.option('--source-home', 'source_home_str', type=str, default='seed_datasets')
+    @click.option('--output', 'output_str', type=str, default='results/sweep')
+    def main(
+        source_strs: tuple[str, ...], targets: tuple[str, ...],
+        grid_specs: tuple[str, ...], random_specs: tuple[str, ...],
+        n_samples: int, n_iter: int, n_repeats: int, workers: int, seed: int,
+        source_home_str: str, output_str: str,
+    ):
+        if grid_specs and random_specs:
+            raise click.UsageError('--grid和--random不能同时使用')
+        try:
+            grid = dict(parse_grid_spec(s) for s in grid_specs)
+            ranges = dict(parse_random_spec(s) for s in random_specs)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+        if random_specs:
+            configs = list(random_configs(ranges, n_samples, seed))
+        else:
+            configs = list(grid_configs(grid))
+        # 在这里解析一次，既检查了参数，文件目标也只读入、建索引一次
+        dests = {target: resolve_target(target) for target in targets}
+        sources = [resolve_source_path(s, Path(source_home_str)) for s in source_strs]
+
+        runs = run_sweep(sources, dests, configs, n_iter,
+                         n_repeats, workers, seed)
+        output = Path(output_str)
+        output.mkdir(parents=True, exist_ok=True)
+        runs.to_csv(output / 'runs.tsv', sep='\t', index=False)
+        if 'error' in runs:
+            failed = runs[runs['error'].notna()]
+            print(f'{len(failed)}次运行失败，详见runs.tsv，例如：{failed.iloc[0].error}')
+            if len(failed) == len(runs): return
+
+        summary = summarize(runs)
+        summary.to_csv(output / 'summary.tsv', sep='\t', index=False)
+        with pd.option_context('display.width', 200, 'display.max_columns', None):
+            print(summary)
+
+    main()
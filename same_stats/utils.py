@@ -1,7 +1,7 @@
 import abc
 from io import BytesIO
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
 
 import av
 import numpy as np
@@ -42,6 +42,40 @@ def read_point_csv(pth: str | Path):
     
     return df.astype(float)
 
+def resolve_source_path(source_path_str: str, source_home_path: Path) -> Path:
+    '''
+    将用户输入的源数据集名解析为文件路径
+    .csv后缀可以省略，相对路径相对于源搜索目录
+    '''
+    source_path = Path(source_path_str)
+    # 如果输入文件名不是.csv结尾，那么加上这个后缀
+    if source_path.suffix != '.csv':
+        source_path = source_path.with_name(source_path.name + '.csv')
+    # 如果输入文件名是相对路径，那么输入文件名将相对于源搜索目录
+    if not source_path.is_absolute():
+        source_path = source_home_path / source_path
+    if not source_path.is_file():
+        raise ValueError(f'找不到源数据集文件({source_path_str}，扩展为{source_path})')
+    return source_path
+
+def resolve_target(target_path_str: str) -> algo.dest_types.IDestination:
+    '''
+    将用户输入的目标名解析为目标图形
+    先在默认的硬编码图形中搜索，找不到再当作csv/json/svg文件路径读取
+    '''
+    if target_path_str in algo.DEFAULT_DESTS:
+        return algo.DEFAULT_DESTS[target_path_str]
+    target_path = Path(target_path_str)
+    if target_path.suffix.lower() in algo.dest_loaders.SUPPORTED_SUFFIXES \
+        and target_path.is_file():
+        return algo.load_destination(target_path)
+    raise ValueError(f'找不到目标图形({target_path_str})')
+
+def target_display_name(target_path_str: str) -> str:
+    '''输出文件中使用的目标图形名，从文件读入的图形用文件名'''
+    if target_path_str in algo.DEFAULT_DESTS: return target_path_str
+    return Path(target_path_str).stem
+
 def create_video(files: list[Path], fps: int, output: Path):
     vid = av.open(str(output), "w")
     vs = vid.add_stream("h264", fps)
@@ -85,31 +119,46 @@ class ILoopIndicator(abc.ABC):
     def increment(self) -> None:
         raise NotImplementedError
 
+    def enter_phase(self, name: str) -> None:
+        '''
+        通知进入某一阶段（setup/render/iterate/video），
+        可用于统计分阶段耗时，默认什么也不做
+        '''
+        pass
+
 
 def run_pattern(
     source: pd.DataFrame, target: algo.dest_types.IDestination,
     n_iter: int, n_frames: int, error_precision: int,
     file_saver: IFileSaver, loop_indicator: ILoopIndicator,
+    algo_params: Optional[dict[str, Any]] = None,
 ):
-    '''运行一次SameState转换'''
+    '''运行一次SameState转换，algo_params为传给SameStatsTransformation的其余参数'''
+    loop_indicator.enter_phase('setup')
     algo_state = algo.SameStatsTransformation(source, target, n_iter,
-                                              n_error_trunc=error_precision)
+                                              n_error_trunc=error_precision,
+                                              **(algo_params or {}))
     image_gen = visual.ImageGenerator(algo_state, n_frames)
 
+    loop_indicator.enter_phase('render')
     img_initial = image_gen.make_scatter()
     file_saver.save_visual_frame(img_initial, 0)
     loop_indicator.init(n_iter)
+    loop_indicator.enter_phase('iterate')
 
     while True:
         completed = algo_state.iterate()
         if algo_state.cur_iter in image_gen.target_iters:
+            loop_indicator.enter_phase('render')
             img = image_gen.make_scatter()
             i_iter = algo_state.cur_iter
             i_frame = image_gen.target_iters[i_iter]
             file_saver.save_data_snapshot(algo_state.cur_state, i_frame, i_iter)
             file_saver.save_visual_frame(img, i_frame)
+            loop_indicator.enter_phase('iterate')
         loop_indicator.increment()
         if completed: break
     
+    loop_indicator.enter_phase('video')
     file_saver.save_video()
 